@@ -0,0 +1,174 @@
+"""
+Monte Carlo balance tuning, running thousands of matches at once with NumPy.
+
+Uses the same level and stage tables as the bot, so changing `PlayerState._STATS_FOR_LEVEL`,
+`PlayerState._XP_TO_NEXT_LEVEL` or `game.TEAM_STAGES` is reflected here straight away.
+
+Unlike `simulate`, every player in a match acts at the same time each simulated second,
+so the hit that ends a match may share its second with a few more throws.
+
+Run with `python balance.py [--matches N] [--team-sizes 10x10 10x12 ...]`
+"""
+
+import argparse
+from dataclasses import dataclass
+
+import numpy as np
+
+from game import TEAM_STAGES, CRIT_HITS_PROGRESS_EFFECT
+from player_state import PlayerState
+from simulate import THROW_CHANCE
+
+TOTAL_LEVELS = PlayerState.TOTAL_LEVELS
+
+
+def _level_table(stat: str) -> np.ndarray:
+	# Indexed by level, 0 is unused
+	return np.array([0] + [PlayerState._STATS_FOR_LEVEL[level][stat] for level in range(1, TOTAL_LEVELS + 1)])
+
+
+MAX_SNOWBALLS = _level_table("max_snowballs")
+COLLECT_COOLDOWN = _level_table("collect_cooldown")
+ACCURACY = _level_table("accuracy")
+CRIT = _level_table("crit")
+
+# Players at the last level don't gain xp, so they never reach this
+XP_TO_NEXT_LEVEL = np.array([0, *PlayerState._XP_TO_NEXT_LEVEL, np.iinfo(np.int32).max])
+
+STAGE_THRESHOLDS = np.cumsum([stage.hits_to_progress for stage in TEAM_STAGES])
+STAGE_XP_BONUS = np.array([stage.xp_bonus for stage in TEAM_STAGES])
+STAGE_CRIT_BONUS = np.array([stage.crit_bonus_percentage for stage in TEAM_STAGES])
+STAGE_COOLDOWN_REDUCTION = np.array([stage.cooldown_reduction_percent for stage in TEAM_STAGES])
+
+
+@dataclass(slots=True)
+class BatchResult:
+	team_sizes: tuple[int, int]
+	match_lengths: np.ndarray  # Simulated seconds, -1 if the match didn't finish
+	winners: np.ndarray  # Winning team, -1 if the match didn't finish
+	level_up_times: np.ndarray  # Second each player reached the last level, -1 if they didn't
+
+
+def simulate_batch(num_matches: int, team_sizes: tuple[int, int], rng: np.random.Generator, max_secs: int = 3600) -> BatchResult:
+	team_0_size, team_1_size = team_sizes
+	num_players = team_0_size + team_1_size
+
+	team = np.array([0] * team_0_size + [1] * team_1_size)
+	# Targets are picked from the other team, which sits at these offsets
+	target_offset = np.where(team == 0, team_0_size, 0)
+	num_targets = np.where(team == 0, team_1_size, team_0_size)
+
+	shape = (num_matches, num_players)
+	level = np.ones(shape, dtype=np.int32)
+	xp = np.zeros(shape, dtype=np.int32)
+	snowballs = np.zeros(shape, dtype=np.int32)
+	last_collect_time = np.full(shape, -np.inf)
+	level_up_times = np.full(shape, -1)
+
+	team_hits = np.zeros((num_matches, 2), dtype=np.int32)
+	team_crit_hits = np.zeros((num_matches, 2), dtype=np.int32)
+
+	active = np.ones(num_matches, dtype=bool)
+	match_lengths = np.full(num_matches, -1)
+	winners = np.full(num_matches, -1)
+
+	for now in range(1, max_secs + 1):
+		if not active.any():
+			break
+
+		progress = team_hits + (team_crit_hits * CRIT_HITS_PROGRESS_EFFECT).astype(np.int32)
+		stage = np.minimum(np.searchsorted(STAGE_THRESHOLDS, progress, side="right"), len(TEAM_STAGES) - 1)
+		player_stage = stage[:, team]
+
+		acting = active[:, None]
+		throwing = acting & (snowballs > 0) & (rng.random(shape) < THROW_CHANCE)
+
+		# Collect
+		cooldown = COLLECT_COOLDOWN[level] * (1 - STAGE_COOLDOWN_REDUCTION[player_stage] / 100)
+		collecting = acting & ~throwing & (now - last_collect_time > cooldown) & (snowballs < MAX_SNOWBALLS[level])
+
+		snowballs += collecting
+		last_collect_time[collecting] = now
+
+		# Throw
+		snowballs -= throwing
+
+		is_hit = throwing & (rng.random(shape) < ACCURACY[level] / 100)
+		is_crit = is_hit & (rng.random(shape) < (CRIT[level] / 100) * (1 + STAGE_CRIT_BONUS[player_stage] / 100))
+
+		targets = target_offset + (rng.random(shape) * num_targets).astype(np.int32)
+		crit_matches, crit_players = np.nonzero(is_crit)
+		snowballs[crit_matches, targets[crit_matches, crit_players]] = 0
+
+		# Hits by team 0 land on team 1, and the other way around
+		team_hits[:, 1] += (is_hit & (team == 0)).sum(axis=1)
+		team_hits[:, 0] += (is_hit & (team == 1)).sum(axis=1)
+		team_crit_hits[:, 1] += (is_crit & (team == 0)).sum(axis=1)
+		team_crit_hits[:, 0] += (is_crit & (team == 1)).sum(axis=1)
+
+		# A completed snowman loses the match, ties are settled with a coin flip
+		progress = team_hits + (team_crit_hits * CRIT_HITS_PROGRESS_EFFECT).astype(np.int32)
+		completed = progress >= STAGE_THRESHOLDS[-1]
+
+		finished = active & completed.any(axis=1)
+		coin_flip = rng.integers(0, 2, num_matches)
+		winners[finished] = np.where(
+			completed[:, 0] & completed[:, 1],
+			coin_flip,
+			np.where(completed[:, 1], 0, 1)
+		)[finished]
+		match_lengths[finished] = now
+
+		# XP, hits in a finishing match don't get any, like the game ending hit in the bot
+		gains_xp = is_hit & ~finished[:, None] & (level < TOTAL_LEVELS)
+		xp_gained = rng.integers(3, 6, shape) + STAGE_XP_BONUS[player_stage] + is_crit * rng.integers(2, 4, shape)
+		xp += np.where(gains_xp, xp_gained, 0)
+
+		xp_needed = XP_TO_NEXT_LEVEL[level]
+		leveled_up = gains_xp & (xp >= xp_needed)
+		xp -= np.where(leveled_up, xp_needed, 0)
+		level += leveled_up
+
+		level_up_times[leveled_up & (level == TOTAL_LEVELS)] = now
+
+		active &= ~finished
+
+	return BatchResult(team_sizes, match_lengths, winners, level_up_times)
+
+
+def _percentiles(values: np.ndarray) -> str:
+	if len(values) == 0:
+		return "n/a"
+
+	p10, p50, p90 = np.percentile(values, (10, 50, 90))
+	return f"p10 {p10:.0f}s, p50 {p50:.0f}s, p90 {p90:.0f}s"
+
+
+def print_report(result: BatchResult):
+	finished = result.match_lengths >= 0
+	reached_max_level = result.level_up_times[finished] >= 0
+
+	print(f"Teams {result.team_sizes[0]} vs {result.team_sizes[1]}:")
+	print(f"  Finished: {finished.mean() * 100:.1f}% of {len(result.match_lengths)} matches")
+	print(f"  Match length: {_percentiles(result.match_lengths[finished])}")
+	print(f"  Team 0 win rate: {(result.winners[finished] == 0).mean() * 100:.1f}%")
+	print(f"  Reached level {TOTAL_LEVELS}: {reached_max_level.mean() * 100:.1f}% of players")
+	print(f"  Time to level {TOTAL_LEVELS}: {_percentiles(result.level_up_times[finished][reached_max_level])}")
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--matches", type=int, default=2000)
+	parser.add_argument("--team-sizes", nargs="+", default=["10x10", "10x12", "10x15"], help="Team 0 size x team 1 size")
+	parser.add_argument("--seed", type=int, default=None)
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(args.seed)
+
+	for team_sizes in args.team_sizes:
+		team_0_size, team_1_size = (int(size) for size in team_sizes.split("x"))
+		print_report(simulate_batch(args.matches, (team_0_size, team_1_size), rng))
+
+
+if __name__ == "__main__":
+	main()
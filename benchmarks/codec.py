@@ -0,0 +1,89 @@
+"""
+Compares the json and binary (record_codec) player record formats: encode and decode
+throughput, and bytes per record, for players with a growing number of opponents.
+
+Decoding json includes turning the opponent ids back into ints, as PlayerStats.load
+has to, since json stores them as strings.
+
+Run from the repo root with `python -m benchmarks.codec`
+"""
+
+import json
+import random
+import time
+
+from record_codec import encode_record, decode_record
+
+NUM_RECORDS = 10_000
+OPPONENT_COUNTS = (0, 10, 100)
+
+
+def make_record(num_opponents: int) -> dict:
+	def opponents() -> dict[str, int]:
+		# Stored the way to_data leaves them after a round trip through json
+		return {str(random.randrange(10 ** 17, 10 ** 19)): random.randint(1, 50) for _ in range(num_opponents)}
+
+	return {
+		"team_id": random.randint(1, 2),
+		"active": True,
+		"level": random.randint(1, 7),
+		"xp": random.randint(0, 80),
+		"snowball_count": random.randint(0, 10),
+		"max_snowballs": 10,
+		"collect_cooldown": 5,
+		"accuracy": 90,
+		"crit": 65,
+		"num_thrown": random.randint(0, 5_000),
+		"num_hits": random.randint(0, 3_000),
+		"num_been_hit": random.randint(0, 3_000),
+		"num_been_crit_hit": random.randint(0, 1_000),
+		"hit_by": opponents(),
+		"has_hit": opponents(),
+		"seq": random.randint(0, 10 ** 7)
+	}
+
+
+def json_decode(contents: str) -> dict:
+	data = json.loads(contents)
+	data["hit_by"] = {int(key): value for key, value in data["hit_by"].items()}
+	data["has_hit"] = {int(key): value for key, value in data["has_hit"].items()}
+
+	return data
+
+
+def measure(records: list[dict], encode, decode) -> tuple[float, float, float]:
+	"""
+	:return: (encodes per sec, decodes per sec, average bytes per record)
+	"""
+
+	start_time = time.perf_counter()
+	encoded = [encode(record) for record in records]
+	encode_secs = time.perf_counter() - start_time
+
+	start_time = time.perf_counter()
+	decoded = [decode(contents) for contents in encoded]
+	decode_secs = time.perf_counter() - start_time
+
+	# Checks the round trip as well, opponent ids come back as ints either way
+	for record, data in zip(records, decoded):
+		if data != json_decode(json.dumps(record)):
+			raise AssertionError("Record changed in a round trip")
+
+	num_bytes = sum(len(contents.encode() if isinstance(contents, str) else contents) for contents in encoded)
+
+	return len(records) / encode_secs, len(records) / decode_secs, num_bytes / len(records)
+
+
+def main():
+	print(f"{"opponents":>10} {"format":>8} {"encode/s":>12} {"decode/s":>12} {"bytes":>8}")
+
+	for num_opponents in OPPONENT_COUNTS:
+		records = [make_record(num_opponents) for _ in range(NUM_RECORDS)]
+
+		for name, encode, decode in (("json", json.dumps, json_decode), ("binary", encode_record, decode_record)):
+			encodes_per_sec, decodes_per_sec, bytes_per_record = measure(records, encode, decode)
+			print(f"{num_opponents:>10} {name:>8} {encodes_per_sec:>12.0f} {decodes_per_sec:>12.0f} {bytes_per_record:>8.0f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,160 @@
+"""
+Times the bot's command handlers against stub Discord objects, without any network.
+
+Every command in `main` is run against guilds of increasing size, once with stats
+saved as json files and once kept in memory, and the p50/p99 latency and throughput
+of each are reported.
+
+Run from the repo root with `python -m benchmarks.commands [--output results.json]`
+"""
+
+import argparse
+import asyncio
+import json
+import pathlib
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+import main
+from benchmarks.stubs import FakeGuild, FakeBot, FakeContext
+from outbox import outbox
+from stats_store import store
+from storage import JsonStorage, MemoryStorage, StatsStorage
+from team import TeamGroup
+
+PLAYER_COUNTS = (100, 1_000, 10_000)
+ITERATIONS = 200
+DISTRIBUTE_ITERATIONS = 5
+
+
+async def _time(iterations: int, setup, command) -> list[float]:
+	"""
+	:return: Latency of each run in seconds, setup isn't timed
+	"""
+
+	latencies = []
+	for _ in range(iterations):
+		args = setup()
+
+		start_time = time.perf_counter()
+		await command(*args)
+		latencies.append(time.perf_counter() - start_time)
+
+	return latencies
+
+
+async def run_scenario(num_players: int, storage_name: str, storage: StatsStorage, iterations: int) -> list[dict]:
+	# Anything left over belongs to the previous scenario's storage
+	await store.aflush()
+	store.storage = storage
+	await store.aload_all()
+
+	guild = FakeGuild(num_players)
+	bot = FakeBot(guild)
+
+	main.teams = TeamGroup()
+	main.teams.load(guild)
+	main.teams.ready = True
+
+	def context() -> FakeContext:
+		return FakeContext(guild, bot, random.choice(guild.members))
+
+	def throw_setup():
+		ctx = context()
+		main.teams.get_player(ctx.author).stats.add_snowball()
+
+		target = random.choice(guild.members)
+		while target == ctx.author:
+			target = random.choice(guild.members)
+
+		return ctx, target
+
+	timings = {
+		"dist_members": await _time(DISTRIBUTE_ITERATIONS, lambda: (context(),), main.distribute_members),
+		"collect": await _time(iterations, lambda: (context(),), main.collect),
+		"throw": await _time(iterations, throw_setup, lambda ctx, target: main.throw(ctx, member=target)),
+		"stats": await _time(iterations, lambda: (context(), random.choice(guild.members)), main.stats),
+		"leader": await _time(iterations, lambda: (context(), None), main.leader),
+	}
+
+	# The timings don't count for much if the commands left the teams wrong
+	problems = main.teams.check_team_aggregates()
+	if problems:
+		raise AssertionError(f"Team aggregates drifted with {num_players} players on {storage_name}:\n" + "\n".join(problems))
+
+	results = []
+	for command_name, latencies in timings.items():
+		results.append({
+			"command": command_name,
+			"players": num_players,
+			"storage": storage_name,
+			"iterations": len(latencies),
+			"p50_ms": statistics.median(latencies) * 1000,
+			"p99_ms": statistics.quantiles(latencies, n=100)[98] * 1000 if len(latencies) > 1 else latencies[0] * 1000,
+			"ops_per_sec": len(latencies) / sum(latencies)
+		})
+
+	return results
+
+
+def _git_commit() -> str | None:
+	try:
+		return subprocess.run(["git", "rev-parse", "HEAD"], cwd=pathlib.Path(__file__).parent, capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+async def run(player_counts: tuple[int, ...], iterations: int) -> dict:
+	# Discord's rate limits aren't part of what's being measured
+	outbox.period = 0
+
+	flusher = asyncio.create_task(store.run())
+
+	results = []
+	with tempfile.TemporaryDirectory() as data_dir:
+		for num_players in player_counts:
+			for storage_name, storage in (("memory", MemoryStorage()), ("json", JsonStorage(pathlib.Path(data_dir)))):
+				results.extend(await run_scenario(num_players, storage_name, storage, iterations))
+
+		# Stopped before the final flush, so nothing is still writing when the directory is removed
+		flusher.cancel()
+		try:
+			await flusher
+		except asyncio.CancelledError:
+			pass
+
+		await store.aflush()
+
+	return {
+		"commit": _git_commit(),
+		"python": platform.python_version(),
+		"results": results
+	}
+
+
+def main_():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--players", type=int, nargs="+", default=list(PLAYER_COUNTS))
+	parser.add_argument("--iterations", type=int, default=ITERATIONS)
+	parser.add_argument("--output", type=pathlib.Path, default=None, help="Also write the results to this json file")
+	args = parser.parse_args()
+
+	report = asyncio.run(run(tuple(args.players), args.iterations))
+
+	print(f"{"command":<14}{"players":>8}{"storage":>8}{"p50 ms":>10}{"p99 ms":>10}{"ops/s":>10}")
+	for result in report["results"]:
+		print(
+			f"{result["command"]:<14}{result["players"]:>8}{result["storage"]:>8}"
+			f"{result["p50_ms"]:>10.3f}{result["p99_ms"]:>10.3f}{result["ops_per_sec"]:>10.0f}"
+		)
+
+	if args.output is not None:
+		args.output.write_text(json.dumps(report, indent="\t"))
+
+
+if __name__ == "__main__":
+	main_()
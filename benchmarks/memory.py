@@ -0,0 +1,52 @@
+"""
+Measures how much memory resident players take up.
+
+Run from the repo root with `python -m benchmarks.memory`
+"""
+
+import gc
+import tracemalloc
+
+from benchmarks.stubs import FakeMember
+from player import Player
+
+PLAYER_COUNTS = (1_000, 10_000, 100_000)
+NUM_OPPONENTS = 10
+
+
+def measure(num_players: int, num_opponents: int) -> float:
+	"""
+	:return: Bytes per player
+	"""
+
+	members = [FakeMember(member_id) for member_id in range(1, num_players + 1)]
+
+	gc.collect()
+	tracemalloc.start()
+
+	players = []
+	for member in members:
+		player = Player(member)
+
+		for opponent_id in range(num_opponents):
+			# Written directly, going through throw()/hit() would queue every player to be saved
+			player.stats._hit_by[opponent_id] = 1
+			player.stats._has_hit[opponent_id] = 1
+
+		players.append(player)
+
+	size, _ = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	return size / num_players
+
+
+def main():
+	print(f"{"players":>10} {"new (B/player)":>16} {f"{NUM_OPPONENTS} opponents (B/player)":>26}")
+
+	for num_players in PLAYER_COUNTS:
+		print(f"{num_players:>10} {measure(num_players, 0):>16.0f} {measure(num_players, NUM_OPPONENTS):>26.0f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,91 @@
+"""
+Fires thousands of concurrent collects and throws at a TeamGroup, with replies that
+take a random amount of time, then checks that the game state is still consistent.
+
+Run from the repo root with `python -m benchmarks.stress`
+"""
+
+import asyncio
+import random
+
+from benchmarks.stubs import FakeGuild, FakeContext
+from outbox import outbox
+from stats_store import store
+from storage import MemoryStorage
+from team import TeamGroup
+
+NUM_MEMBERS = 200
+NUM_ACTIONS = 20_000
+MAX_REPLY_DELAY = 0.002
+
+
+def start_game(teams: TeamGroup):
+	member_ids = list(teams.member_ids)
+	random.shuffle(member_ids)
+
+	team_ids = dict.fromkeys(member_ids[:len(member_ids) // 2], 1)
+	team_ids.update(dict.fromkeys(member_ids[len(member_ids) // 2:], 2))
+	teams.reassign(team_ids)
+
+
+def check_invariants(teams: TeamGroup):
+	problems = teams.check_team_aggregates()
+	assert not problems, "Team aggregates drifted:\n" + "\n".join(problems)
+
+	total_hits = 0
+	total_been_hit = 0
+	for member_id in teams.member_ids:
+		stats = teams._get_stats(member_id)
+
+		assert 0 <= stats.num_snowballs <= stats.max_snowballs, f"{member_id} has {stats.num_snowballs} snowballs"
+		assert stats.num_hits <= stats.num_thrown
+		assert teams.leaderboard.rank(member_id) is not None
+
+		total_hits += stats.num_hits
+		total_been_hit += stats.num_been_hit
+
+	assert total_hits == total_been_hit, "Hits and times hit don't match"
+
+
+async def act(teams: TeamGroup, guild: FakeGuild, stats: dict[str, int]):
+	member = random.choice(guild.members)
+
+	# Nobody has a cooldown, so that collects can keep up with throws
+	teams.get_player(member).last_collect_time = None
+
+	if random.random() < 0.5:
+		await teams.collect_for(FakeContext(guild, None, member, MAX_REPLY_DELAY), member)
+		stats["collects"] += 1
+		return
+
+	target = random.choice(guild.members)
+	if await teams.throw_for(FakeContext(guild, None, member, MAX_REPLY_DELAY), member, target):
+		# Same reset as the game over in main.throw
+		teams.reassign(dict.fromkeys(teams.member_ids, 0))
+		start_game(teams)
+		stats["games"] += 1
+
+	stats["throws"] += 1
+
+
+async def main():
+	store.storage = MemoryStorage()
+	# Replies are already slowed down by MAX_REPLY_DELAY
+	outbox.period = 0
+
+	guild = FakeGuild(NUM_MEMBERS)
+
+	teams = TeamGroup()
+	teams.load(guild)
+	start_game(teams)
+
+	stats = {"collects": 0, "throws": 0, "games": 0}
+	await asyncio.gather(*(act(teams, guild, stats) for _ in range(NUM_ACTIONS)))
+	await store.aflush()
+
+	check_invariants(teams)
+	print(f"{stats["collects"]} collects, {stats["throws"]} throws, {stats["games"]} games finished, invariants hold")
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+Stand-ins for the Discord objects the bot uses, shared by the benchmarks so they run
+without a connection to Discord.
+"""
+
+import asyncio
+import random
+
+import discord
+
+
+class FakeMember(discord.Member):
+	# Shadow the properties that read from discord's internal state
+	id = name = nick = global_name = display_name = mention = bot = None
+
+	def __init__(self, member_id: int):  # NoQA, skips discord.Member's constructor on purpose
+		self.id = member_id
+		self.name = f"member{member_id}"
+		self.nick = self.name
+		self.global_name = self.name
+		self.display_name = self.name
+		self.mention = f"<@{member_id}>"
+		self.bot = False
+
+	def __hash__(self):
+		return hash(self.id)
+
+
+class FakeChannel:
+	def __init__(self, channel_id: int, name: str):
+		self.id = channel_id
+		self.name = name
+		self.mention = f"#{name}"
+
+	async def send(self, *args, **kwargs):
+		pass
+
+	def overwrites_for(self, role) -> discord.PermissionOverwrite:
+		return discord.PermissionOverwrite()
+
+	async def set_permissions(self, *args, **kwargs):
+		pass
+
+
+class FakeGuild:
+	def __init__(self, num_members: int):
+		self.members = [FakeMember(member_id) for member_id in range(1, num_members + 1)]
+		self._members_by_id = {member.id: member for member in self.members}
+
+		self.default_role = object()
+		self._channel = FakeChannel(1, "weird-balls")
+
+	def get_member(self, member_id: int) -> FakeMember | None:
+		return self._members_by_id.get(member_id)
+
+	def get_channel(self, channel_id: int) -> FakeChannel:
+		return self._channel
+
+
+class FakeBot:
+	def __init__(self, guild: FakeGuild):
+		self._guild = guild
+
+	def get_user(self, user_id: int) -> FakeMember | None:
+		return self._guild.get_member(user_id)
+
+
+async def _respond(delay: float):
+	if delay > 0:
+		await asyncio.sleep(random.random() * delay)
+
+
+class FakeMessage:
+	def __init__(self, delay: float = 0):
+		self.delay = delay
+
+	async def delete(self, *, delay: float | None = None):
+		await _respond(self.delay)
+
+
+class FakeContext:
+	def __init__(self, guild: FakeGuild, bot: FakeBot, author: FakeMember, delay: float = 0):
+		"""
+		:param delay: Max seconds each reply, send or delete takes, picked at random for each
+		"""
+
+		self.guild = guild
+		self.bot = bot
+		self.author = author
+		self.channel = guild.get_channel(0)
+		self.message = FakeMessage(delay)
+		self.interaction = None
+
+		self.delay = delay
+
+	async def reply(self, *args, **kwargs):
+		await _respond(self.delay)
+
+	async def send(self, *args, **kwargs):
+		await _respond(self.delay)
@@ -2,26 +2,77 @@ import pathlib
 
 import discord
 
-with open("private.txt", "r") as private:
-	BOT_API = private.read()
-
 COMMAND_PREFIX = "!"
 
 WEIRD_GUYS_GUILD_ID = 688195144943796294
 ANNOUNCEMENTS_CHANNEL_ID = 766380173787398144
 WEIRD_BALLS_CHANNEL_ID = 1317762286198460416
 
-IGNORED_MEMBERS = (
+IGNORED_MEMBERS = frozenset((
 	"iamplankton8065",
 	"ergergerg1159",
 	"teachamantoafish3188",
 	"bernieferdinand",
 	"grandmofftarkin6912",
 	"domeyboy"
-)
+))
 
 CWD = pathlib.Path.cwd()
 DATA_DIR = CWD / "data"
+DATABASE_PATH = CWD / "weird_guys.db"
+
+# "json" for one file per member in DATA_DIR, "binary" for the same but in the compact format
+# from record_codec, "sqlite" for a single database at DATABASE_PATH, "memory" to not save anything
+# Existing json data can be moved over to sqlite with `python storage.py`, or to binary with storage.convert_storage
+STORAGE_BACKEND = "json"
+
+# Players beyond this are dropped from memory once idle, and recreated from the stats store when needed
+MAX_RESIDENT_PLAYERS = 500
+
+# Startup reads the json data files in batches of LOAD_BATCH_SIZE across LOAD_WORKERS threads
+LOAD_BATCH_SIZE = 64
+LOAD_WORKERS = 8
+
+# Dirty player stats are written out together, either every SAVE_INTERVAL_SECS
+# or as soon as SAVE_DIRTY_THRESHOLD players are waiting to be saved
+SAVE_INTERVAL_SECS = 5
+SAVE_DIRTY_THRESHOLD = 50
+# Max number of flushes that can be waiting on the stats I/O thread
+SAVE_QUEUE_SIZE = 4
+
+# Every change to player stats is also appended here, and replayed on startup to recover
+# anything the saved stats missed. None to not keep a log
+EVENT_LOG_PATH = CWD / "events.log"
+# Logged events are written out and fsynced together at this interval
+EVENT_LOG_FLUSH_SECS = 1
+
+# Times the hot paths and counts game events, shown with !metrics
+# When off, the instrumentation is skipped entirely
+METRICS_ENABLED = True
+# Serves the metrics as Prometheus text at http://127.0.0.1:<port>/metrics, None to not serve them
+METRICS_PORT = 9108
+
+# Messages are sent at most CHANNEL_SEND_BURST at a time per channel, refilling over CHANNEL_SEND_PERIOD_SECS
+CHANNEL_SEND_BURST = 5
+CHANNEL_SEND_PERIOD_SECS = 5
+
+# Snowman stages for each curve, as (hits to progress, xp bonus, crit bonus %, cooldown reduction %)
+TEAM_STAGE_CURVES = {
+	"default": (
+		(40, 0, 0, 0),
+		(50, 1, 20, 25),
+		(60, 2, 40, 50),
+	),
+}
+# Each match plays on the next curve here, teams keep the curve they were created with until the game is over
+TEAM_STAGE_CURVE_ROTATION = ("default",)
+
+# Throws in these channels only get a reaction, and are posted together every FIGHT_FEED_INTERVAL_SECS
+# Channels can also be switched over with !feed
+FIGHT_FEED_CHANNEL_IDS = frozenset()
+FIGHT_FEED_INTERVAL_SECS = 5
+# Throws listed in each digest, the rest are only counted
+FIGHT_FEED_MAX_LINES = 15
 
 NO_PING = discord.AllowedMentions(everyone=False, users=False, roles=False)
 
@@ -48,3 +99,5 @@ COLLECT_COMMAND_NAME = "collect"
 THROW_COMMAND_NAME = "throw"
 LEADERBOARD_COMMAND_NAME = "leader"
 STATS_COMMAND_NAME = "stats"
+METRICS_COMMAND_NAME = "metrics"
+FEED_COMMAND_NAME = "feed"
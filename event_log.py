@@ -0,0 +1,168 @@
+"""
+Append-only log of every game action, one JSON object per line.
+
+Changes to player stats are appended here as they happen, next to the snapshots in
+the stats store. Appending only buffers the event; the stats store writes the buffer
+out on its I/O thread and fsyncs once per batch.
+
+The snapshots are the checkpoint. Each time the stats store finishes writing every
+dirty player, it records the last event they include and where the log was at that
+point. On startup, the events after the checkpoint are replayed with
+`player_stats.replay`, to recover anything the snapshots missed.
+"""
+
+import json
+import os
+import pathlib
+import time
+
+from storage import write_atomic, sync_dir
+
+
+class EventLog:
+	def __init__(self):
+		self.path: pathlib.Path | None = None
+		self._file = None
+
+		self._pending: list[str] = []
+		self._seq = 0
+
+		# Set while replaying, so replayed changes aren't logged a second time
+		self.replaying = False
+
+	@property
+	def is_open(self) -> bool:
+		return self._file is not None
+
+	@property
+	def checkpoint_path(self) -> pathlib.Path:
+		return self.path.with_name(self.path.name + ".checkpoint")
+
+	def _read_checkpoint(self) -> tuple[int, int]:
+		"""
+		:return: (seq, offset), or the start of the log if there's no usable checkpoint
+		"""
+
+		try:
+			checkpoint = json.loads(self.checkpoint_path.read_text())
+			return checkpoint["seq"], checkpoint["offset"]
+		except (OSError, ValueError, KeyError):
+			return 0, 0
+
+	def open(self, path: pathlib.Path, min_seq: int = 0, lost_ids: set[int] = frozenset()) -> list[dict]:
+		"""
+		Opens the log for appending
+
+		:param min_seq: Highest sequence number already in the snapshots, so a new
+		or replaced log doesn't reuse numbers that replaying would skip
+		:param lost_ids: Members whose snapshots couldn't be read, their whole history is replayed
+		:return: Events after the last checkpoint, to be replayed
+		"""
+
+		self.path = path
+
+		checkpoint_seq, offset = self._read_checkpoint()
+		self._seq = max(checkpoint_seq, min_seq)
+
+		if lost_ids:
+			offset = 0
+
+		events = []
+		if path.exists():
+			with open(path, "rb") as file:
+				# A checkpoint past the end belongs to a log that has since been replaced
+				if offset > os.fstat(file.fileno()).st_size:
+					checkpoint_seq, offset = 0, 0
+
+				file.seek(offset)
+
+				for line in file:
+					try:
+						event = json.loads(line)
+					except ValueError:
+						# Torn write from a crash mid-append
+						continue
+
+					self._seq = max(self._seq, event["seq"])
+
+					if event["seq"] > checkpoint_seq or event.get("id") in lost_ids:
+						events.append(event)
+
+		is_new = not path.exists()
+		self._file = open(path, "ab")
+
+		# Otherwise a power loss could lose the whole log, fsyncing it only covers its contents
+		if is_new:
+			sync_dir(path.parent)
+
+		# Keep a torn line on its own, instead of appending the next event onto it
+		if self._file.tell() != 0:
+			with open(path, "rb") as file:
+				file.seek(-1, os.SEEK_END)
+				if file.read(1) != b"\n":
+					self._file.write(b"\n")
+
+		return events
+
+	def append(self, event_type: str, **fields) -> int:
+		"""
+		:return: The event's sequence number, 0 if it wasn't logged
+		"""
+
+		if self._file is None or self.replaying:
+			return 0
+
+		self._seq += 1
+
+		event = {"seq": self._seq, "time": round(time.time(), 3), "type": event_type}
+		event.update(fields)
+		self._pending.append(json.dumps(event, separators=(",", ":")) + "\n")
+
+		return self._seq
+
+	def take(self) -> tuple[list[str], int]:
+		"""
+		Hands over the events that haven't been written yet
+
+		:return: (lines, seq of the last event logged so far)
+		"""
+
+		pending = self._pending
+		self._pending = []
+
+		return pending, self._seq
+
+	def write(self, lines: list[str]) -> int:
+		"""
+		:return: Offset of the end of the log after writing
+		"""
+
+		if self._file is None:
+			return 0
+
+		if lines:
+			self._file.write("".join(lines).encode())
+			self._file.flush()
+			os.fsync(self._file.fileno())
+
+		return self._file.tell()
+
+	def write_checkpoint(self, seq: int, offset: int):
+		"""
+		Marks every event up to `seq` as included in the stored snapshots
+
+		:param offset: Where the events after `seq` start in the log
+		"""
+
+		if self._file is None:
+			return
+
+		write_atomic(self.checkpoint_path, json.dumps({"seq": seq, "offset": offset}))
+
+	def close(self):
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+
+event_log = EventLog()
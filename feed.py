@@ -0,0 +1,142 @@
+"""
+Fight feed, an optional channel mode where throws are summed up in a digest.
+
+In a feed channel a throw only gets a reaction on the command message. The throw
+itself is added to the channel's digest, which is posted as a single embed every
+`interval` seconds with the hits, misses, crits, level ups and snowman progress since
+the last one. However many throws there are, a channel gets one message per interval.
+"""
+
+import asyncio
+from typing import TYPE_CHECKING
+
+import discord
+
+from consts import FIGHT_FEED_CHANNEL_IDS, FIGHT_FEED_INTERVAL_SECS, FIGHT_FEED_MAX_LINES, STATS_COLOR, LEVEL_UP_COLOR, NO_PING
+from game import ThrowResult
+from outbox import outbox, Priority
+
+if TYPE_CHECKING:
+	from player import Player
+
+HIT_REACTION = "💥"
+CRIT_REACTION = "⚡"
+MISS_REACTION = "💨"
+
+
+class _Digest:
+	__slots__ = ("channel", "num_hits", "num_crits", "num_misses", "lines", "num_hidden_lines", "level_ups", "team_level_ups")
+
+	def __init__(self, channel: discord.abc.GuildChannel):
+		self.channel = channel
+
+		self.num_hits = 0
+		self.num_crits = 0
+		self.num_misses = 0
+
+		# Only the first FIGHT_FEED_MAX_LINES throws are listed
+		self.lines: list[str] = []
+		self.num_hidden_lines = 0
+
+		self.level_ups: list[str] = []
+		# Team id to its level up embed, only the latest per team is kept
+		self.team_level_ups: dict[int, discord.Embed] = {}
+
+	def add_line(self, line: str):
+		if len(self.lines) < FIGHT_FEED_MAX_LINES:
+			self.lines.append(line)
+		else:
+			self.num_hidden_lines += 1
+
+	def to_embeds(self) -> list[discord.Embed]:
+		summary = f"Hits: `{self.num_hits}` (`{self.num_crits}` critical)\n"
+		summary += f"Misses: `{self.num_misses}`\n\n"
+		summary += "\n".join(self.lines)
+		if self.num_hidden_lines != 0:
+			summary += f"\n...and `{self.num_hidden_lines}` more"
+
+		embeds = [discord.Embed(title="Fight feed", description=summary, color=STATS_COLOR)]
+
+		if self.level_ups:
+			embeds.append(discord.Embed(
+				title="Level ups",
+				description="\n".join(self.level_ups[:FIGHT_FEED_MAX_LINES]),
+				color=LEVEL_UP_COLOR
+			))
+
+		embeds.extend(self.team_level_ups.values())
+
+		return embeds
+
+
+class FightFeed:
+	def __init__(self, channel_ids: frozenset[int] = FIGHT_FEED_CHANNEL_IDS, interval: float = FIGHT_FEED_INTERVAL_SECS):
+		self.channel_ids = set(channel_ids)
+		self.interval = interval
+
+		self._digests: dict[int, _Digest] = {}
+
+	def is_feed_channel(self, channel_id: int) -> bool:
+		return channel_id in self.channel_ids
+
+	def toggle(self, channel_id: int) -> bool:
+		"""
+		:return: Whether the channel is now a feed channel
+		"""
+
+		if channel_id in self.channel_ids:
+			self.channel_ids.remove(channel_id)
+			return False
+
+		self.channel_ids.add(channel_id)
+		return True
+
+	def add_throw(self, channel: discord.abc.GuildChannel, thrower: "Player", target: "Player", result: ThrowResult):
+		digest = self._digests.get(channel.id)
+		if digest is None:
+			digest = self._digests[channel.id] = _Digest(channel)
+
+		if not result.is_hit:
+			digest.num_misses += 1
+			digest.add_line(f"{MISS_REACTION} {thrower.member.mention} missed {target.member.mention}")
+			return
+
+		digest.num_hits += 1
+		if result.is_crit:
+			digest.num_crits += 1
+			digest.add_line(f"{CRIT_REACTION} {thrower.member.mention} critically hit {target.member.mention}")
+		else:
+			digest.add_line(f"{HIT_REACTION} {thrower.member.mention} hit {target.member.mention}")
+
+		if result.leveled_up:
+			digest.level_ups.append(f"{thrower.member.mention} is now level `{result.level}`")
+
+		if result.team_response:
+			digest.team_level_ups[result.target_team.id] = result.target_team.level_up_embed(result.target_team_stage)
+
+	async def publish(self):
+		# Swapped out first, so throws during the sends go in the next digest
+		digests = self._digests
+		self._digests = {}
+
+		await asyncio.gather(*(
+			outbox.send_to(
+				digest.channel,
+				embeds=digest.to_embeds(),
+				allowed_mentions=NO_PING,
+				priority=Priority.GAME if digest.team_level_ups else Priority.REPLY
+			)
+			for digest in digests.values()
+		))
+
+	async def run(self):
+		while True:
+			await asyncio.sleep(self.interval)
+
+			try:
+				await self.publish()
+			except Exception as e:
+				print(f"Failed to publish fight feed: {e!r}")
+
+
+feed = FightFeed()
@@ -0,0 +1,266 @@
+"""
+Game rules, independent of Discord and of where the stats are stored.
+
+Every state change happens in one of the functions here, which return a result
+object describing what happened. `Player` and `TeamGroup` turn those results into
+Discord messages, and `simulate` uses them directly on plain `PlayerState`s to play
+out whole matches.
+"""
+
+import itertools
+import math
+import random
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from consts import TEAM_STAGE_CURVES, TEAM_STAGE_CURVE_ROTATION
+from metrics import metrics
+
+if TYPE_CHECKING:
+	from player_state import PlayerState
+
+
+class TeamStage:
+	__slots__ = ("hits_to_progress", "xp_bonus", "crit_bonus_percentage", "cooldown_reduction_percent")
+
+	def __init__(
+			self,
+			hits_to_progress: int,
+			xp_bonus: int,
+			crit_bonus_percentage: int,
+			cooldown_reduction_percent: int
+	):
+		self.hits_to_progress = hits_to_progress
+
+		self.xp_bonus = xp_bonus
+		self.crit_bonus_percentage = crit_bonus_percentage
+		self.cooldown_reduction_percent = cooldown_reduction_percent
+
+
+class StageCurve:
+	"""
+	A snowman's stages, with the hits needed to finish each one summed up front
+	so the stage for any number of hits is a binary search
+	"""
+
+	__slots__ = ("name", "stages", "thresholds")
+
+	def __init__(self, name: str, stages: tuple[TeamStage, ...]):
+		if not stages:
+			raise ValueError(f"Stage curve {name} has no stages")
+
+		self.name = name
+		self.stages = stages
+
+		# Effective hits at which each stage is finished
+		self.thresholds = tuple(itertools.accumulate(stage.hits_to_progress for stage in stages))
+
+	@classmethod
+	def from_config(cls, name: str) -> "StageCurve":
+		return cls(name, tuple(TeamStage(*stage) for stage in TEAM_STAGE_CURVES[name]))
+
+	def __len__(self) -> int:
+		return len(self.stages)
+
+	def stage_index(self, effective_hits: int) -> int:
+		"""
+		:return: Number of stages finished, len(self) once all of them are
+		"""
+
+		return bisect_right(self.thresholds, effective_hits)
+
+	def stage_start(self, stage_index: int) -> int:
+		"""
+		:return: Effective hits at which the stage begins
+		"""
+
+		return self.thresholds[stage_index - 1] if stage_index > 0 else 0
+
+
+STAGE_CURVES = {name: StageCurve.from_config(name) for name in TEAM_STAGE_CURVES}
+TEAM_CURVE = STAGE_CURVES[TEAM_STAGE_CURVE_ROTATION[0]]
+TEAM_STAGES = TEAM_CURVE.stages
+BASE_TEAM_CURVE = StageCurve("base", (TeamStage(0, 0, 0, 0),))
+
+# How much a critical hit counts towards the snowman, on top of the hit itself
+CRIT_HITS_PROGRESS_EFFECT = 0.5
+
+
+class Snowman:
+	"""
+	A team's progress through its stages, driven by how many times its members have been hit
+	"""
+
+	__slots__ = ("curve", "_current_stage_index", "total_been_hits", "crit_hits", "effective_hits", "version")
+
+	def __init__(self, curve: StageCurve = TEAM_CURVE):
+		self.curve = curve
+
+		self._current_stage_index = 0
+
+		self.total_been_hits = 0
+		self.crit_hits = 0
+		# Hits towards the stages, kept up to date by add_hits and hit_player_on_team
+		self.effective_hits = 0
+
+		self.version = 0
+
+	@property
+	def current_stage(self) -> TeamStage:
+		if self._current_stage_index >= len(self.curve):
+			return self.curve.stages[-1]
+
+		return self.curve.stages[self._current_stage_index]
+
+	@property
+	def stage_progress(self) -> int:
+		"""
+		Effective hits into the current stage
+		"""
+
+		return self.effective_hits - self.curve.stage_start(self._current_stage_index)
+
+	def add_hits(self, num_been_hit: int, num_crit_hits: int):
+		"""
+		Adds to the hit counts without moving the stage, see _calculate_stage_index
+		"""
+
+		self.total_been_hits += num_been_hit
+		self.crit_hits += num_crit_hits
+		self.effective_hits = self.total_been_hits + int(self.crit_hits * CRIT_HITS_PROGRESS_EFFECT)
+
+	def check_hits(self, num_been_hit: int, num_crit_hits: int, rebuild: bool = False) -> list[str]:
+		"""
+		Compares the hit counts against ones recounted from the team's players
+
+		:param rebuild: Whether to replace the counts with the recounted ones if they're off
+		:return: What didn't match, empty if everything did
+		"""
+
+		problems = []
+		if self.total_been_hits != num_been_hit:
+			problems.append(f"hits are {self.total_been_hits}, recounted {num_been_hit}")
+		if self.crit_hits != num_crit_hits:
+			problems.append(f"crit hits are {self.crit_hits}, recounted {num_crit_hits}")
+		if self.effective_hits != num_been_hit + int(num_crit_hits * CRIT_HITS_PROGRESS_EFFECT):
+			problems.append(f"effective hits are {self.effective_hits}")
+		if self._current_stage_index != self.curve.stage_index(self.effective_hits):
+			problems.append(f"stage is {self._current_stage_index + 1}, should be {self.curve.stage_index(self.effective_hits) + 1}")
+
+		if problems and rebuild:
+			self.total_been_hits = 0
+			self.crit_hits = 0
+			self.add_hits(num_been_hit, num_crit_hits)
+			self._calculate_stage_index()
+
+		return problems
+
+	@metrics.timed("team.calculate_stage_index")
+	def _calculate_stage_index(self):
+		self.version += 1
+		self._current_stage_index = self.curve.stage_index(self.effective_hits)
+
+	def hit_player_on_team(self, critical: bool) -> int:
+		self.add_hits(1, critical)
+		self.version += 1
+
+		if self._current_stage_index >= len(self.curve):
+			return 0
+
+		if self.effective_hits >= self.curve.thresholds[self._current_stage_index]:
+			self._current_stage_index = self.curve.stage_index(self.effective_hits)
+
+			if self._current_stage_index >= len(self.curve):
+				return 2
+
+			return 1
+
+		return 0
+
+
+@dataclass(slots=True)
+class CollectResult:
+	collected: bool
+	num_snowballs: int
+
+	# Only set when still on cooldown
+	cooldown_remaining: int | None = None
+
+
+@dataclass(slots=True)
+class ThrowResult:
+	is_hit: bool
+	is_crit: bool
+	num_snowballs: int
+
+	xp_gained: int = 0
+	leveled_up: bool = False
+	level: int = 0
+
+	# 0: No change, 1: Target team's stage went up, 2: Game over
+	team_response: int = 0
+	target_team: Snowman | None = None
+	target_team_stage: TeamStage | None = None
+
+
+def get_collect_cooldown(stats: "PlayerState", last_collect_time: float, cooldown_reduction_percent: int, now: float) -> float:
+	"""
+	:return: Seconds until the player can collect again, <= 0 if they already can
+	"""
+
+	return stats.collect_cooldown * (1 - cooldown_reduction_percent / 100) - (now - last_collect_time)
+
+
+def collect(stats: "PlayerState", last_collect_time: float | None, cooldown_reduction_percent: int, now: float) -> CollectResult:
+	if last_collect_time is not None:
+		cooldown_remaining = get_collect_cooldown(stats, last_collect_time, cooldown_reduction_percent, now)
+
+		if cooldown_remaining >= 0:
+			return CollectResult(collected=False, num_snowballs=stats.num_snowballs, cooldown_remaining=math.ceil(cooldown_remaining))
+
+	collected = stats.add_snowball()
+
+	return CollectResult(collected=collected, num_snowballs=stats.num_snowballs)
+
+
+def throw(
+		thrower: "PlayerState",
+		target: "PlayerState",
+		thrower_stage: TeamStage,
+		target_team: Snowman,
+		rng: random.Random = random
+) -> ThrowResult | None:
+	"""
+	:param thrower_stage: Current stage of the thrower's team, for its bonuses
+	:param target_team: Snowman of the target's team, which grows on a hit
+	:return: None if the thrower has no snowballs
+	"""
+
+	if thrower.num_snowballs == 0:
+		return None
+
+	is_hit = rng.random() < thrower.accuracy / 100
+	is_crit = is_hit and rng.random() < (thrower.crit_chance / 100) * (1 + thrower_stage.crit_bonus_percentage / 100)
+
+	thrower.throw(target.member_id, is_hit)
+
+	result = ThrowResult(is_hit=is_hit, is_crit=is_crit, num_snowballs=thrower.num_snowballs)
+	if not is_hit:
+		return result
+
+	target.hit(is_crit, thrower.member_id)
+	result.target_team = target_team
+	result.team_response = target_team.hit_player_on_team(is_crit)
+	result.target_team_stage = target_team.current_stage
+	if result.team_response == 2:  # Game over
+		return result
+
+	result.xp_gained = rng.randint(3, 5) + thrower_stage.xp_bonus
+	if is_crit:
+		result.xp_gained += rng.randint(2, 3)
+
+	result.leveled_up = thrower.add_xp(result.xp_gained)
+	result.level = thrower.level
+
+	return result
@@ -1,17 +1,54 @@
 import logging
-from typing import Mapping, Optional, List, Any, TYPE_CHECKING
+from typing import Mapping, Optional, List, Any, Callable, TYPE_CHECKING
 
 import discord
 from discord.ext import commands
 
-from consts import COMMAND_PREFIX, SIGN_UP_COMMAND_NAME, DISTRIBUTE_MEMBERS_COMMAND_NAME, HELP_COLOR
+from consts import COMMAND_PREFIX, SIGN_UP_COMMAND_NAME, DISTRIBUTE_MEMBERS_COMMAND_NAME, METRICS_COMMAND_NAME, FEED_COMMAND_NAME, HELP_COLOR
 
 if TYPE_CHECKING:
 	from team import TeamGroup
 
 
+class FieldCache:
+	"""
+	Embed fields rendered from something that carries a version, like PlayerStats and Snowman.
+	Their versions are bumped on every change, so the fields are only rendered again once the
+	version has moved on since the last render
+	"""
+
+	__slots__ = ("_version", "_fields")
+
+	def __init__(self):
+		self._version: int | None = None
+		self._fields: list[tuple[str, str, bool]] = []
+
+	def get(self, version: int, render: Callable[[], list[tuple[str, str, bool]]]) -> list[tuple[str, str, bool]]:
+		"""
+		:return: (name, value, inline) for every field
+		"""
+
+		if self._version != version:
+			self._fields = render()
+			self._version = version
+
+		return self._fields
+
+
 class CustomHelpCommand(commands.HelpCommand):
+	# Commands don't change while the bot is running, so the embeds are only built once.
+	# Kept on the class, as discord.py copies the help command for every use
+	_bot_help_embed: discord.Embed | None = None
+	_command_help_embeds: dict[str, discord.Embed] = {}
+
 	async def send_bot_help(self, mapping: Mapping[Optional[commands.Cog], List[commands.Command[Any, ..., Any]]], /) -> None:
+		if CustomHelpCommand._bot_help_embed is None:
+			CustomHelpCommand._bot_help_embed = self._build_bot_help_embed(mapping)
+
+		await self.get_destination().send(embed=CustomHelpCommand._bot_help_embed)
+
+	@staticmethod
+	def _build_bot_help_embed(mapping: Mapping[Optional[commands.Cog], List[commands.Command[Any, ..., Any]]]) -> discord.Embed:
 		embed = discord.Embed(
 			title="Commands",
 			description="",
@@ -21,7 +58,7 @@ class CustomHelpCommand(commands.HelpCommand):
 		total_commands = [e for bot_commands in mapping.values() for e in bot_commands]
 
 		for index, command in enumerate(total_commands):
-			if command.name in (SIGN_UP_COMMAND_NAME, DISTRIBUTE_MEMBERS_COMMAND_NAME):
+			if command.name in (SIGN_UP_COMMAND_NAME, DISTRIBUTE_MEMBERS_COMMAND_NAME, METRICS_COMMAND_NAME, FEED_COMMAND_NAME):
 				continue
 
 			tail = ""
@@ -35,9 +72,17 @@ class CustomHelpCommand(commands.HelpCommand):
 				inline=False
 			)
 
-		await self.get_destination().send(embed=embed)
+		return embed
 
 	async def send_command_help(self, command: commands.Command):
+		embed = CustomHelpCommand._command_help_embeds.get(command.qualified_name)
+		if embed is None:
+			embed = CustomHelpCommand._command_help_embeds[command.qualified_name] = self._build_command_help_embed(command)
+
+		await self.get_destination().send(embed=embed)
+
+	@staticmethod
+	def _build_command_help_embed(command: commands.Command) -> discord.Embed:
 		embed = discord.Embed(
 			title=f"Command: {command.name}",
 			description=command.help or "No description provided.",
@@ -49,7 +94,8 @@ class CustomHelpCommand(commands.HelpCommand):
 			value=f"```{command.usage}```" if command.usage is not None else f"```{COMMAND_PREFIX}{command.name}```",
 			inline=False
 		)
-		await self.get_destination().send(embed=embed)
+
+		return embed
 
 
 class TeamSignUpView(discord.ui.View):
@@ -62,7 +108,9 @@ class TeamSignUpView(discord.ui.View):
 	async def sign_up_button_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
 		response: discord.InteractionResponse = interaction.response  # Typing issue # NoQA
 
-		if not self.team_group.get_player(interaction.user).stats.active:
+		if not self.team_group.check_is_player(interaction.user):
+			await response.send_message(f"User {interaction.user} is not a player", ephemeral=True)
+		elif not self.team_group.get_player(interaction.user).stats.active:
 			self.team_group.mark_member_active(interaction.user)
 			print(f"{interaction.user.name} has signed up ({interaction.user.id})")
 
@@ -74,13 +122,6 @@ class TeamSignUpView(discord.ui.View):
 
 def xp_bar(current: int, total: int, length: int = 10) -> str:
 	ratio = current / total
-	swap_point = round(length * ratio)
-
-	result = ""
-	for i in range(length):
-		if i < swap_point:
-			result += "🟩"
-		else:
-			result += "🟨"
+	swap_point = min(max(round(length * ratio), 0), length)
 
-	return result
+	return "🟩" * swap_point + "🟨" * (length - swap_point)
@@ -0,0 +1,59 @@
+from bisect import bisect_left, insort
+
+
+class Leaderboard:
+	"""
+	Members ranked by number of hits, kept sorted as hits come in.
+
+	Lookups are binary searches, and updates move a single entry, so reading the
+	top players never needs a full sort.
+	"""
+
+	__slots__ = ("_ranking", "_num_hits")
+
+	def __init__(self):
+		# (-num_hits, member_id), so the most hits come first and ties are ordered by id
+		self._ranking: list[tuple[int, int]] = []
+		self._num_hits: dict[int, int] = {}
+
+	def __len__(self) -> int:
+		return len(self._ranking)
+
+	def __contains__(self, member_id: int) -> bool:
+		return member_id in self._num_hits
+
+	def items(self) -> dict[int, int]:
+		"""
+		:return: Member id to number of hits, in no particular order
+		"""
+
+		return dict(self._num_hits)
+
+	def update(self, member_id: int, num_hits: int):
+		old_num_hits = self._num_hits.get(member_id)
+		if old_num_hits == num_hits:
+			return
+
+		if old_num_hits is not None:
+			del self._ranking[bisect_left(self._ranking, (-old_num_hits, member_id))]
+
+		self._num_hits[member_id] = num_hits
+		insort(self._ranking, (-num_hits, member_id))
+
+	def remove(self, member_id: int):
+		num_hits = self._num_hits.pop(member_id, None)
+		if num_hits is not None:
+			del self._ranking[bisect_left(self._ranking, (-num_hits, member_id))]
+
+	def top(self, num_members: int) -> list[int]:
+		return [member_id for _, member_id in self._ranking[:num_members]]
+
+	def rank(self, member_id: int) -> int | None:
+		"""
+		:return: 1 for the most hits, members with the same number of hits share a rank
+		"""
+
+		if member_id not in self._num_hits:
+			return None
+
+		return bisect_left(self._ranking, (-self._num_hits[member_id],)) + 1
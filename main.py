@@ -1,12 +1,20 @@
+import asyncio
 import random
+import time
 import typing
 
 import discord
 from discord.ext import commands
 
-from consts import BOT_API, WEIRD_GUYS_GUILD_ID, IGNORED_MEMBERS, NO_PING, COMMAND_PREFIX, STATS_COLOR, SIGN_UP_COMMAND_NAME, DISTRIBUTE_MEMBERS_COMMAND_NAME, COLLECT_COMMAND_NAME, THROW_COMMAND_NAME, LEADERBOARD_COMMAND_NAME, STATS_COMMAND_NAME, TEAMS_COLOR, GAME_OVER_COLOR, WEIRD_BALLS_CHANNEL_ID, ANNOUNCEMENTS_CHANNEL_ID
+from consts import WEIRD_GUYS_GUILD_ID, NO_PING, COMMAND_PREFIX, STATS_COLOR, SIGN_UP_COMMAND_NAME, DISTRIBUTE_MEMBERS_COMMAND_NAME, COLLECT_COMMAND_NAME, THROW_COMMAND_NAME, LEADERBOARD_COMMAND_NAME, STATS_COMMAND_NAME, TEAMS_COLOR, GAME_OVER_COLOR, WEIRD_BALLS_CHANNEL_ID, ANNOUNCEMENTS_CHANNEL_ID, METRICS_COMMAND_NAME, METRICS_PORT, FEED_COMMAND_NAME, EVENT_LOG_PATH
+from event_log import event_log
+from feed import feed
 from graphics import CustomHelpCommand, TeamSignUpView
-from player import Player
+from member_index import member_index, IndexedMemberConverter
+from metrics import metrics
+from player_stats import replay
+from outbox import outbox, Priority
+from stats_store import store
 from team import TeamGroup
 
 intents = discord.Intents.default()
@@ -15,28 +23,108 @@ intents.members = True
 
 bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents, help_command=CustomHelpCommand())
 
+# Slash commands are only registered in the one guild, which updates straight away unlike global ones
+slash_command_guild = discord.Object(id=WEIRD_GUYS_GUILD_ID)
+
 teams = TeamGroup()
 
+metrics.add_gauges("stats_store", store.metrics)
+metrics.add_gauges("outbox", outbox.metrics)
+
 
 @bot.check
 async def predicate(ctx: commands.Context):
-	return ctx.channel.name in ("weird-bots", "weird-balls")
+	# Players only exist once on_ready has finished loading them
+	return teams.ready and ctx.channel.name in ("weird-bots", "weird-balls")
+
+
+@bot.event
+async def setup_hook():
+	# Keep a reference so the flusher task isn't garbage collected
+	bot.stats_flusher = asyncio.create_task(store.run())
+	bot.fight_feed = asyncio.create_task(feed.run())
+
+	await bot.tree.sync(guild=slash_command_guild)
+
+	if metrics.enabled and METRICS_PORT is not None:
+		bot.metrics_server = asyncio.create_task(metrics.serve(METRICS_PORT))
+
+
+@bot.before_invoke
+async def start_command_timer(ctx: commands.Context):
+	ctx.start_time = time.perf_counter()
+
+
+@bot.after_invoke
+async def stop_command_timer(ctx: commands.Context):
+	# Also called when the command raised
+	metrics.observe(f"command.{ctx.command.qualified_name}", time.perf_counter() - ctx.start_time)
 
 
 @bot.event
 async def on_ready():
+	# on_ready is called again after reconnects
+	if teams.ready:
+		return
+
 	weird_guys_guild = bot.get_guild(WEIRD_GUYS_GUILD_ID)
 
-	# Init members as players
-	for member in weird_guys_guild.members:
-		if not member.bot and member.name not in IGNORED_MEMBERS:
-			teams.add_player(Player(member))
+	start_time = time.perf_counter()
+	await store.aload_all()
+
+	if EVENT_LOG_PATH is not None:
+		events = await asyncio.to_thread(event_log.open, EVENT_LOG_PATH, store.max_seq, store.storage.invalid_ids)
+		print(f"Replayed {replay(events)} of {len(events)} logged events")
+
+		# Saves the replayed stats, and checkpoints the log
+		await store.aflush()
+
+	member_index.load(weird_guys_guild)
+	teams.load(weird_guys_guild)
+
+	teams.ready = True
+	print(f"Loaded {len(teams.member_ids)} players ({store.num_records} saved) in {time.perf_counter() - start_time:.2f}s")
 
 	bot.add_view(TeamSignUpView(teams))
 
 	print(f'Logged in as {bot.user}')
 
 
+# Keep the member index in sync with the guild
+@bot.event
+async def on_member_join(member: discord.Member):
+	if member.guild.id == WEIRD_GUYS_GUILD_ID:
+		member_index.add(member)
+
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+	if after.guild.id == WEIRD_GUYS_GUILD_ID and after.nick != before.nick:
+		member_index.add(after)
+
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+	if member.guild.id == WEIRD_GUYS_GUILD_ID:
+		member_index.remove(member.id)
+
+
+@bot.event
+async def on_user_update(before: discord.User, after: discord.User):
+	# Names and global names are changed on the user, which members share
+	member = member_index.get(after.id)
+	if member is not None:
+		member_index.add(member)
+
+
+def did_you_mean(argument: str) -> str:
+	suggestions = member_index.suggest(argument)
+	if not suggestions:
+		return ""
+
+	return "\nDid you mean " + ", ".join(member.mention for member in suggestions) + "?"
+
+
 # @bot.command()
 # async def ping(ctx: commands.Context):
 # 	message = f"This message is in channel: {ctx.channel}\n"
@@ -78,57 +166,33 @@ Other commands you can use include:
 	await channel.send("Press the button to sign up as active member: ", view=TeamSignUpView(teams))
 
 
-@bot.command(name=DISTRIBUTE_MEMBERS_COMMAND_NAME)
-@commands.is_owner()
-async def distribute_members(ctx: commands.Context):
-	# Add active members
-	active_players = teams.get_active_players()
-	num_active_members = len(active_players)
+def split_in_two(member_ids: typing.Iterable[int]) -> tuple[list[int], list[int]]:
+	member_ids = list(member_ids)
+	random.shuffle(member_ids)
 
-	num_team_1 = num_active_members // 2
+	num_team_1 = len(member_ids) // 2
 
 	# Randomly distribute odd member if needed
-	if num_active_members % 2 != 0:
+	if len(member_ids) % 2 != 0:
 		if random.random() > 0.5:
 			num_team_1 += 1
 
-	team_1_active_players: list[Player] = random.sample(active_players, num_team_1)
-	for player in team_1_active_players:
-		teams.remove_player(player)
-		player.stats.set_team(1)
-		teams.add_player(player)
+	return member_ids[:num_team_1], member_ids[num_team_1:]
 
-		active_players.remove(player)
 
-	for player in active_players:
-		teams.remove_player(player)
-		player.stats.set_team(2)
-		teams.add_player(player)
-
-	# Add remaining members
-	non_active_players = teams.get_non_active_players()
-	num_non_active_members = len(non_active_players)
-
-	num_team_1 = num_non_active_members // 2
-
-	# Randomly distribute odd member if needed
-	if num_non_active_members % 2 != 0:
-		if random.random() > 0.5:
-			num_team_1 += 1
-
-	team_1_non_active_players: list[Player] = random.sample(non_active_players, num_team_1)
-
-	for player in team_1_non_active_players:
-		teams.remove_player(player)
-		player.stats.set_team(1)
-		teams.add_player(player)
+@bot.command(name=DISTRIBUTE_MEMBERS_COMMAND_NAME)
+@commands.is_owner()
+async def distribute_members(ctx: commands.Context):
+	# Split active members evenly, then the remaining members
+	active_team_1, active_team_2 = split_in_two(teams.active_ids)
+	non_active_team_1, non_active_team_2 = split_in_two(teams.member_ids - teams.active_ids)
 
-		non_active_players.remove(player)
+	team_ids = dict.fromkeys(active_team_1 + non_active_team_1, 1)
+	team_ids.update(dict.fromkeys(active_team_2 + non_active_team_2, 2))
 
-	for player in non_active_players:
-		teams.remove_player(player)
-		player.stats.set_team(2)
-		teams.add_player(player)
+	# Saved by the flusher in the background, the announcements don't wait on writing every player
+	teams.reassign(team_ids)
+	store.request_flush()
 
 	team_1_message = ""
 	for player in sorted(teams.get_players_on_team(1), key=lambda e: e.stats.active, reverse=True):
@@ -169,9 +233,9 @@ Start throwing in {balls_channel.mention}!
 P.S. Hit the *other* team.
 """
 
-	await announcements_channel.send(message)
-	await announcements_channel.send(embed=team_1_embed)
-	await announcements_channel.send(embed=team_2_embed)
+	await outbox.send_to(announcements_channel, message, priority=Priority.GAME)
+	await outbox.send_to(announcements_channel, embed=team_1_embed, priority=Priority.GAME)
+	await outbox.send_to(announcements_channel, embed=team_2_embed, priority=Priority.GAME)
 
 	# Open up the weird_balls channel to everyone
 	role = ctx.guild.default_role
@@ -182,6 +246,41 @@ P.S. Hit the *other* team.
 	await balls_channel.set_permissions(role, overwrite=overwrite)
 
 
+@bot.command(name=METRICS_COMMAND_NAME)
+@commands.is_owner()
+async def show_metrics(ctx: commands.Context):
+	if not metrics.enabled:
+		await ctx.send("Metrics are disabled")
+		return
+
+	embed = discord.Embed(
+		title="Metrics",
+		color=STATS_COLOR
+	)
+
+	counters_message = "\n".join(f"{name}: `{value}`" for name, value in sorted(metrics.counters.items()))
+	embed.add_field(name="Counters:", value=counters_message or "None yet", inline=False)
+
+	timers_message = ""
+	for name, timer in sorted(metrics.timers.items()):
+		timers_message += f"{name}: `{timer.count}` calls, avg `{timer.average * 1000:.2f}` ms, max `{timer.max * 1000:.2f}` ms\n"
+	embed.add_field(name="Timers:", value=timers_message or "None yet", inline=False)
+
+	gauges_message = "\n".join(f"{name}: `{value:.4g}`" for name, value in sorted(metrics.gauges().items()))
+	embed.add_field(name="Gauges:", value=gauges_message, inline=False)
+
+	await ctx.send(embed=embed)
+
+
+@bot.command(name=FEED_COMMAND_NAME)
+@commands.is_owner()
+async def toggle_feed(ctx: commands.Context):
+	if feed.toggle(ctx.channel.id):
+		await ctx.send(f"Throws in this channel will be posted together every `{feed.interval}` seconds")
+	else:
+		await ctx.send("Throws in this channel will be replied to individually")
+
+
 @bot.command(name=COLLECT_COMMAND_NAME, help="Collects a snowball")
 async def collect(ctx: commands.Context):
 	await teams.collect_for(ctx, ctx.author)
@@ -193,12 +292,13 @@ async def collect(ctx: commands.Context):
 	usage="""Usage:
   !throw <member>"""
 )
-async def throw(ctx: commands.Context, *, member: typing.Union[discord.Member, str]):
+async def throw(ctx: commands.Context, *, member: typing.Union[IndexedMemberConverter, str]):
 	if isinstance(member, discord.Member):
 		check_game_over = await teams.throw_for(ctx, ctx.author, member)
 
-		author = teams.get_player(ctx.author)
-		if not author.team.base_team and check_game_over:
+		# Only players can finish a game, so the author has a Player here
+		author = teams.get_player(ctx.author) if check_game_over else None
+		if check_game_over and not author.team.base_team:
 			winning_team_players = teams.get_players_on_team(author.team.id)
 
 			message = f"Team `{author.team.id}` won!\n\n"
@@ -217,30 +317,69 @@ async def throw(ctx: commands.Context, *, member: typing.Union[discord.Member, s
 				colour=GAME_OVER_COLOR
 			)
 
-			players = list(teams.players.values())
-			for player in players:
-				teams.remove_player(player)
+			# Reset before anything is awaited, so no other throw lands on the finished teams
+			event_log.append("game_over", winner=author.team.id)
 
-			for player in players:
-				player.stats.set_team(0)
-				teams.add_player(player)
+			teams.reassign(dict.fromkeys(teams.member_ids, 0))
+			teams.start_next_match()
+			store.request_flush()
 
-			await ctx.send(embed=embed, allowed_mentions=NO_PING)
-			await ctx.guild.get_channel(ANNOUNCEMENTS_CHANNEL_ID).send(embed=embed, allowed_mentions=NO_PING)
+			await outbox.send(ctx, embed=embed, allowed_mentions=NO_PING, priority=Priority.GAME)
+			await outbox.send_to(ctx.guild.get_channel(ANNOUNCEMENTS_CHANNEL_ID), embed=embed, allowed_mentions=NO_PING, priority=Priority.GAME)
 	else:
-		await ctx.send(f"Could not find user {member}", allowed_mentions=NO_PING)
+		await outbox.send(ctx, f"Could not find user {member}" + did_you_mean(member), allowed_mentions=NO_PING, priority=Priority.COSMETIC)
+
+
+async def invoke_from_interaction(interaction: discord.Interaction, command: commands.Command, **kwargs):
+	"""
+	Runs a prefix command for a slash command, going through the same checks
+	"""
+
+	ctx = await commands.Context.from_interaction(interaction)
+
+	if not await predicate(ctx):
+		await ctx.send("You can't play here", ephemeral=True)
+		return
+
+	start_time = time.perf_counter()
+	try:
+		await command(ctx, **kwargs)
+	finally:
+		metrics.observe(f"command.{command.qualified_name}.slash", time.perf_counter() - start_time)
+
 
+@bot.tree.command(name=COLLECT_COMMAND_NAME, description="Collects a snowball", guild=slash_command_guild)
+async def collect_slash(interaction: discord.Interaction):
+	await invoke_from_interaction(interaction, collect)
 
-@bot.command(name=LEADERBOARD_COMMAND_NAME, help="Prints top 3 player stats")
-async def leader(ctx: commands.Context):
-	sorted_players = teams.get_sorted_players()
+
+@bot.tree.command(name=THROW_COMMAND_NAME, description="Throws snowball at target", guild=slash_command_guild)
+@discord.app_commands.describe(member="Who to throw at")
+async def throw_slash(interaction: discord.Interaction, member: discord.Member):
+	# Discord resolves the member, so there's no name lookup like with !throw
+	await invoke_from_interaction(interaction, throw, member=member)
+
+
+@bot.command(
+	name=LEADERBOARD_COMMAND_NAME,
+	help="Prints top 3 player stats",
+	usage="""Usage:
+  !leader           -> Top 3 players
+  !leader <team_id> -> Top 3 players on specified team"""
+)
+async def leader(ctx: commands.Context, team_id: typing.Optional[int]):
+	if team_id is not None and not teams.is_team(team_id):
+		await outbox.send(ctx, f"Could not find team {team_id}", allowed_mentions=NO_PING, priority=Priority.COSMETIC)
+		return
+
+	top_players = teams.get_top_players(3, team_id)
 
 	embed = discord.Embed(
-		title="Leaderboard",
+		title="Leaderboard" if team_id is None else f"Team `{team_id}` Leaderboard",
 		color=STATS_COLOR
 	)
 
-	for index, player in enumerate(sorted_players[:3]):
+	for index, player in enumerate(top_players):
 		player_field_title = "" if index == 0 else r"**\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_\_**"
 		player_field_title += f"\n{index + 1}: **{player.member.nick}**"
 
@@ -249,9 +388,13 @@ async def leader(ctx: commands.Context):
 			value="", inline=False
 		)
 
-		player.embed_stats(ctx, embed, include_xp_stats=False)
+		player.embed_stats(embed, include_xp_stats=False)
 
-	await ctx.send(embed=embed, allowed_mentions=NO_PING)
+	rank = teams.get_rank(ctx.author, team_id)
+	if rank is not None:
+		embed.set_footer(text=f"Your rank: #{rank}")
+
+	await outbox.send(ctx, embed=embed, allowed_mentions=NO_PING)
 
 
 @bot.command(
@@ -262,13 +405,13 @@ async def leader(ctx: commands.Context):
   !stats <member>  -> Stats of specified member
   !stats <team_id> -> Stats of specified team"""
 )
-async def stats(ctx: commands.Context, target: typing.Optional[typing.Union[discord.Member, str]]):
+async def stats(ctx: commands.Context, target: typing.Optional[typing.Union[IndexedMemberConverter, str]]):
 	if isinstance(target, discord.Member) or target is None:
 		if target is None:
 			target = ctx.author
 
 		if not teams.check_is_player(target):
-			await ctx.send(f"Unable to process {target}")
+			await outbox.send(ctx, f"Unable to process {target}", priority=Priority.COSMETIC)
 			return
 
 		embed = discord.Embed(
@@ -276,9 +419,9 @@ async def stats(ctx: commands.Context, target: typing.Optional[typing.Union[disc
 			color=STATS_COLOR
 		)
 
-		teams.get_player(target).embed_stats(ctx, embed)
+		teams.get_player(target).embed_stats(embed)
 
-		await ctx.send(embed=embed, allowed_mentions=NO_PING)
+		await outbox.send(ctx, embed=embed, allowed_mentions=NO_PING)
 	else:
 		if target.isnumeric() and teams.is_team(int(target)):
 			embed = discord.Embed(
@@ -288,10 +431,15 @@ async def stats(ctx: commands.Context, target: typing.Optional[typing.Union[disc
 
 			teams.get_team(int(target)).embed_stats(embed)
 
-			await ctx.send(embed=embed, allowed_mentions=NO_PING)
+			await outbox.send(ctx, embed=embed, allowed_mentions=NO_PING)
 
 		else:
-			await ctx.send(f"Could not find target {target}", allowed_mentions=NO_PING)
+			await outbox.send(ctx, f"Could not find target {target}" + did_you_mean(target), allowed_mentions=NO_PING, priority=Priority.COSMETIC)
+
 
+if __name__ == "__main__":
+	with open("private.txt", "r") as private:
+		bot.run(private.read())
 
-bot.run(BOT_API)
+	# Write out anything still waiting once the bot has shut down
+	store.close()
@@ -0,0 +1,152 @@
+import re
+from bisect import bisect_left, insort
+
+import discord
+from discord.ext import commands
+
+# Suggestions fall back to shorter prefixes of the argument, but never shorter than this
+MIN_SUGGESTION_PREFIX = 2
+
+_MENTION_PATTERN = re.compile(r"<@!?([0-9]{15,20})>$")
+_ID_PATTERN = re.compile(r"([0-9]{15,20})$")
+
+
+class MemberIndex:
+	"""
+	Guild members by id and by every name they go by: name, global name and nickname.
+
+	Names are matched case-insensitively. They're also kept sorted, so members whose
+	names start with some prefix are found with a binary search instead of a scan.
+	"""
+
+	__slots__ = ("_members", "_names", "_ids_by_name", "_sorted_names")
+
+	def __init__(self):
+		self._members: dict[int, discord.Member] = {}
+		# Names each member was indexed under, discord.py updates cached members in place
+		self._names: dict[int, set[str]] = {}
+
+		# Lowercase name to the ids of members going by it, as an ordered set
+		self._ids_by_name: dict[str, dict[int, None]] = {}
+		self._sorted_names: list[str] = []
+
+	def __len__(self) -> int:
+		return len(self._members)
+
+	@staticmethod
+	def _names_of(member: discord.Member) -> set[str]:
+		return {name.lower() for name in (member.name, member.global_name, member.nick) if name}
+
+	def load(self, guild: discord.Guild):
+		self._members.clear()
+		self._names.clear()
+		self._ids_by_name.clear()
+
+		for member in guild.members:
+			self._members[member.id] = member
+			self._names[member.id] = self._names_of(member)
+
+			for name in self._names[member.id]:
+				self._ids_by_name.setdefault(name, {})[member.id] = None
+
+		self._sorted_names = sorted(self._ids_by_name)
+
+	def add(self, member: discord.Member):
+		if member.id in self._members:
+			self.remove(member.id)
+
+		self._members[member.id] = member
+		self._names[member.id] = self._names_of(member)
+
+		for name in self._names[member.id]:
+			ids = self._ids_by_name.get(name)
+			if ids is None:
+				ids = self._ids_by_name[name] = {}
+				insort(self._sorted_names, name)
+
+			ids[member.id] = None
+
+	def remove(self, member_id: int):
+		if self._members.pop(member_id, None) is None:
+			return
+
+		for name in self._names.pop(member_id):
+			ids = self._ids_by_name[name]
+			del ids[member_id]
+
+			if not ids:
+				del self._ids_by_name[name]
+				del self._sorted_names[bisect_left(self._sorted_names, name)]
+
+	def get(self, member_id: int) -> discord.Member | None:
+		return self._members.get(member_id)
+
+	def resolve(self, argument: str) -> discord.Member | None:
+		"""
+		:param argument: A mention, id, name, global name or nickname
+		"""
+
+		match = _MENTION_PATTERN.match(argument) or _ID_PATTERN.match(argument)
+		if match is not None:
+			member = self._members.get(int(match.group(1)))
+			if member is not None:
+				return member
+
+		ids = self._ids_by_name.get(argument.lower())
+		if ids is None:
+			return None
+
+		members = [self._members[member_id] for member_id in ids]
+
+		# Prefer whoever goes by exactly that name when the case matters
+		for member in members:
+			if argument in (member.name, member.global_name, member.nick):
+				return member
+
+		return members[0]
+
+	def starting_with(self, prefix: str, limit: int) -> list[discord.Member]:
+		prefix = prefix.lower()
+
+		members = {}
+		for index in range(bisect_left(self._sorted_names, prefix), len(self._sorted_names)):
+			name = self._sorted_names[index]
+			if not name.startswith(prefix):
+				break
+
+			for member_id in self._ids_by_name[name]:
+				members[member_id] = self._members[member_id]
+				if len(members) == limit:
+					return list(members.values())
+
+		return list(members.values())
+
+	def suggest(self, argument: str, limit: int = 3) -> list[discord.Member]:
+		"""
+		Members the argument might have been meant to be, trying shorter prefixes
+		of it until something matches, so typos near the end are still caught
+		"""
+
+		for length in range(len(argument), MIN_SUGGESTION_PREFIX - 1, -1):
+			members = self.starting_with(argument[:length], limit)
+			if members:
+				return members
+
+		return []
+
+
+member_index = MemberIndex()
+
+
+class IndexedMemberConverter(commands.Converter[discord.Member]):
+	"""
+	Drop-in for discord.Member arguments, looking members up in `member_index`
+	instead of scanning the guild's member cache
+	"""
+
+	async def convert(self, ctx: commands.Context, argument: str) -> discord.Member:
+		member = member_index.resolve(argument)
+		if member is None:
+			raise commands.MemberNotFound(argument)
+
+		return member
@@ -0,0 +1,172 @@
+"""
+Counters and timers for the bot's hot paths.
+
+Functions are timed by decorating them with `metrics.timed`, and events are counted
+with `metrics.increment`. With METRICS_ENABLED off, `timed` hands back the function
+unchanged and `increment` returns straight away, so instrumented code costs next to nothing.
+
+Everything collected can be read as Prometheus text from `to_prometheus`, which
+`serve` exposes at http://127.0.0.1:<METRICS_PORT>/metrics
+"""
+
+import asyncio
+import functools
+import inspect
+import time
+from collections import Counter
+from typing import Callable
+
+from consts import METRICS_ENABLED
+
+PROMETHEUS_PREFIX = "weird_balls"
+
+
+class Timer:
+	__slots__ = ("count", "total", "max")
+
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	@property
+	def average(self) -> float:
+		return self.total / self.count if self.count != 0 else 0.0
+
+	def observe(self, secs: float):
+		self.count += 1
+		self.total += secs
+		if secs > self.max:
+			self.max = secs
+
+
+class Metrics:
+	def __init__(self, enabled: bool):
+		self.enabled = enabled
+
+		self.counters: Counter[str] = Counter()
+		self.timers: dict[str, Timer] = {}
+
+		# Read when the metrics are, for values that are already tracked elsewhere
+		self._gauge_sources: dict[str, Callable[[], dict[str, float]]] = {}
+
+	def increment(self, name: str, amount: int = 1):
+		if not self.enabled:
+			return
+
+		self.counters[name] += amount
+
+	def observe(self, name: str, secs: float):
+		if not self.enabled:
+			return
+
+		timer = self.timers.get(name)
+		if timer is None:
+			timer = self.timers[name] = Timer()
+
+		timer.observe(secs)
+
+	def timed(self, name: str):
+		"""
+		Decorator recording how long each call takes, works on both functions and coroutines
+		"""
+
+		def decorator(function):
+			if not self.enabled:
+				return function
+
+			if inspect.iscoroutinefunction(function):
+				@functools.wraps(function)
+				async def async_wrapper(*args, **kwargs):
+					start_time = time.perf_counter()
+					try:
+						return await function(*args, **kwargs)
+					finally:
+						self.observe(name, time.perf_counter() - start_time)
+
+				return async_wrapper
+
+			@functools.wraps(function)
+			def wrapper(*args, **kwargs):
+				start_time = time.perf_counter()
+				try:
+					return function(*args, **kwargs)
+				finally:
+					self.observe(name, time.perf_counter() - start_time)
+
+			return wrapper
+
+		return decorator
+
+	def add_gauges(self, prefix: str, source: Callable[[], dict[str, float]]):
+		self._gauge_sources[prefix] = source
+
+	def gauges(self) -> dict[str, float]:
+		gauges = {}
+		for prefix, source in self._gauge_sources.items():
+			for name, value in source().items():
+				gauges[f"{prefix}.{name}"] = value
+
+		return gauges
+
+	def to_prometheus(self) -> str:
+		lines = []
+
+		for name, value in sorted(self.counters.items()):
+			metric_name = _prometheus_name(name) + "_total"
+			lines.append(f"# TYPE {metric_name} counter")
+			lines.append(f"{metric_name} {value}")
+
+		for name, timer in sorted(self.timers.items()):
+			metric_name = _prometheus_name(name) + "_seconds"
+			lines.append(f"# TYPE {metric_name} summary")
+			lines.append(f"{metric_name}_count {timer.count}")
+			lines.append(f"{metric_name}_sum {timer.total}")
+			lines.append(f"# TYPE {metric_name}_max gauge")
+			lines.append(f"{metric_name}_max {timer.max}")
+
+		for name, value in sorted(self.gauges().items()):
+			metric_name = _prometheus_name(name)
+			lines.append(f"# TYPE {metric_name} gauge")
+			lines.append(f"{metric_name} {value}")
+
+		return "\n".join(lines) + "\n"
+
+	async def _handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+		try:
+			request_line = await reader.readline()
+			# Skip the headers
+			while (await reader.readline()).strip():
+				pass
+
+			parts = request_line.decode("latin-1").split()
+			if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+				status = "200 OK"
+				body = self.to_prometheus().encode()
+			else:
+				status = "404 Not Found"
+				body = b""
+
+			writer.write(
+				f"HTTP/1.1 {status}\r\n"
+				f"Content-Type: text/plain; version=0.0.4\r\n"
+				f"Content-Length: {len(body)}\r\n"
+				f"Connection: close\r\n\r\n".encode() + body
+			)
+			await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+
+	async def serve(self, port: int, host: str = "127.0.0.1"):
+		server = await asyncio.start_server(self._handle_request, host, port)
+		async with server:
+			await server.serve_forever()
+
+
+def _prometheus_name(name: str) -> str:
+	return f"{PROMETHEUS_PREFIX}_" + "".join(char if char.isalnum() else "_" for char in name)
+
+
+metrics = Metrics(METRICS_ENABLED)
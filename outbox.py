@@ -0,0 +1,157 @@
+"""
+Outbound message queue, keeping the bot ahead of Discord's rate limits.
+
+Every channel gets a bucket of `burst` sends per `period` seconds. Sends wait in a
+queue per channel until the bucket has room, instead of going out straight away and
+being retried after a 429. When a channel is backed up, messages leave in order of
+`Priority`, so a game over isn't stuck behind a pile of cooldown notices.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from enum import IntEnum
+from typing import Awaitable, Callable, TypeVar
+
+import discord
+from discord.ext import commands
+
+from consts import CHANNEL_SEND_BURST, CHANNEL_SEND_PERIOD_SECS
+from metrics import metrics
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+	GAME = 0  # Game over and anything else players can't miss
+	REPLY = 1  # Results of commands
+	COSMETIC = 2  # Errors and notices that get deleted again
+
+
+class _ChannelQueue:
+	__slots__ = ("sends", "tokens", "last_refill_time", "worker")
+
+	def __init__(self, tokens: float):
+		# (priority, order, send, future)
+		self.sends: list[tuple[int, int, Callable[[], Awaitable], asyncio.Future]] = []
+
+		self.tokens = tokens
+		self.last_refill_time = time.monotonic()
+
+		self.worker: asyncio.Task | None = None
+
+
+class Outbox:
+	def __init__(self, burst: int = CHANNEL_SEND_BURST, period: float = CHANNEL_SEND_PERIOD_SECS):
+		"""
+		:param period: 0 to not limit sends at all
+		"""
+
+		self.burst = burst
+		self.period = period
+
+		self._channels: dict[int, _ChannelQueue] = {}
+		self._order = itertools.count()
+
+		# Keeps a reference so running sends aren't garbage collected
+		self._in_flight: set[asyncio.Task] = set()
+
+	@property
+	def num_queued(self) -> int:
+		return sum(len(channel.sends) for channel in self._channels.values())
+
+	def metrics(self) -> dict[str, float]:
+		return {
+			"queued": self.num_queued,
+			"in_flight": len(self._in_flight)
+		}
+
+	async def submit(self, channel_id: int, priority: Priority, send: Callable[[], Awaitable[T]]) -> T:
+		"""
+		Queues `send` to be called once the channel's bucket has room
+
+		:return: What `send` returned, once it has gone out
+		"""
+
+		channel = self._channels.get(channel_id)
+		if channel is None:
+			channel = self._channels[channel_id] = _ChannelQueue(self.burst)
+
+		future = asyncio.get_running_loop().create_future()
+		heapq.heappush(channel.sends, (priority, next(self._order), send, future))
+
+		if channel.worker is None:
+			channel.worker = asyncio.create_task(self._drain(channel_id, channel))
+
+		return await future
+
+	def reply(self, ctx: commands.Context, *args, priority: Priority = Priority.REPLY, **kwargs) -> Awaitable[discord.Message]:
+		# Interaction responses aren't limited per channel, and have to go out within 3 seconds
+		if ctx.interaction is not None:
+			return ctx.reply(*args, **kwargs)
+
+		return self.submit(ctx.channel.id, priority, lambda: ctx.reply(*args, **kwargs))
+
+	def send(self, ctx: commands.Context, *args, priority: Priority = Priority.REPLY, **kwargs) -> Awaitable[discord.Message]:
+		if ctx.interaction is not None:
+			return ctx.send(*args, **kwargs)
+
+		return self.submit(ctx.channel.id, priority, lambda: ctx.send(*args, **kwargs))
+
+	def send_to(self, channel: discord.abc.GuildChannel, *args, priority: Priority = Priority.REPLY, **kwargs) -> Awaitable[discord.Message]:
+		return self.submit(channel.id, priority, lambda: channel.send(*args, **kwargs))
+
+	def _time_until_available(self, channel: _ChannelQueue) -> float:
+		if self.period == 0:
+			return 0
+
+		now = time.monotonic()
+		channel.tokens = min(self.burst, channel.tokens + (now - channel.last_refill_time) * self.burst / self.period)
+		channel.last_refill_time = now
+
+		if channel.tokens >= 1:
+			return 0
+
+		return (1 - channel.tokens) * self.period / self.burst
+
+	async def _drain(self, channel_id: int, channel: _ChannelQueue):
+		while channel.sends:
+			wait_secs = self._time_until_available(channel)
+			if wait_secs > 0:
+				# Something more important may be queued by the time there's room
+				await asyncio.sleep(wait_secs)
+				continue
+
+			_, _, send, future = heapq.heappop(channel.sends)
+			if future.cancelled():
+				continue
+
+			channel.tokens -= 1
+
+			task = asyncio.create_task(self._send(send, future))
+			self._in_flight.add(task)
+			task.add_done_callback(self._in_flight.discard)
+
+		channel.worker = None
+
+		# Channels are recreated with a full bucket, so only forget ones that have refilled
+		if self.period == 0 or channel.tokens + (time.monotonic() - channel.last_refill_time) * self.burst / self.period >= self.burst:
+			del self._channels[channel_id]
+
+	@staticmethod
+	async def _send(send: Callable[[], Awaitable], future: asyncio.Future):
+		start_time = time.perf_counter()
+		try:
+			result = await send()
+		except Exception as e:
+			if not future.cancelled():
+				future.set_exception(e)
+		else:
+			if not future.cancelled():
+				future.set_result(result)
+		finally:
+			metrics.observe("discord.send", time.perf_counter() - start_time)
+
+
+outbox = Outbox()
@@ -5,18 +5,28 @@ from typing import TYPE_CHECKING
 import discord
 from discord.ext import commands
 
+import game
 from consts import NO_PING, CRITICAL_HIT_COLOR, HIT_COLOR, MISS_COLOR, COLLECT_COLOR, LEVEL_UP_COLOR
-from graphics import xp_bar
+from game import CollectResult, ThrowResult
+from feed import feed, HIT_REACTION, CRIT_REACTION, MISS_REACTION
+from graphics import FieldCache, xp_bar
+from metrics import metrics
+from outbox import outbox, Priority
 from player_stats import PlayerStats
+from stats_store import store
 
 if TYPE_CHECKING:
 	from team import Team
 
 
 class Player:
+	__slots__ = ("member", "stats", "last_collect_time", "team", "_rendered_fields")
+
 	def __init__(self, member: discord.Member):
 		self.member = member
-		self.stats = PlayerStats(member)
+
+		# Unsaved stats are newer than the stored record
+		self.stats = store.get_pending(member.id) or PlayerStats(member.id)
 
 		self.last_collect_time: int | None = None
 
@@ -24,7 +34,22 @@ class Player:
 		# player should always be on a team
 		self.team: Team | None = None  # Set when added to a team
 
-	def embed_stats(self, ctx: commands.Context, embed: discord.Embed, include_xp_stats: bool = True):
+		# The first 3 fields are the short version
+		self._rendered_fields = FieldCache()
+
+	def is_idle(self) -> bool:
+		"""
+		Whether the player can be dropped without losing anything, recreating them would reset their cooldown
+		"""
+
+		return self.last_collect_time is None or time.time() - self.last_collect_time > self.stats.collect_cooldown
+
+	def embed_stats(self, embed: discord.Embed, include_xp_stats: bool = True):
+		fields = self._rendered_fields.get(self.stats.version, self._render_stats_fields)
+		for name, value, inline in (fields if include_xp_stats else fields[:3]):
+			embed.add_field(name=name, value=value, inline=inline)
+
+	def _render_stats_fields(self) -> list[tuple[str, str, bool]]:
 		throw_stats = f"Thrown: `{self.stats.num_thrown}`\n"
 		throw_stats += f"Hits: `{self.stats.num_hits}`\n"
 		throw_stats += f"Misses: `{self.stats.num_thrown - self.stats.num_hits}`\n"
@@ -34,10 +59,10 @@ class Player:
 		has_hit_most = self.stats.get_has_hit_most()
 
 		if hit_by_most[1] != 0:
-			throw_stats += f"\nHit by {ctx.bot.get_user(hit_by_most[0]).mention} `{hit_by_most[1]}` times"
+			throw_stats += f"\nHit by <@{hit_by_most[0]}> `{hit_by_most[1]}` times"
 
 		if has_hit_most[1] != 0:
-			throw_stats += f"\nHas hit {ctx.bot.get_user(has_hit_most[0]).mention} `{has_hit_most[1]}` times"
+			throw_stats += f"\nHas hit <@{has_hit_most[0]}> `{has_hit_most[1]}` times"
 
 		snowball_stats = f"Count: `{self.stats.num_snowballs}`\n"
 		snowball_stats += f"Capacity: `{self.stats.max_snowballs}`\n"
@@ -48,96 +73,138 @@ class Player:
 		general_stats += f"Crit %: `{self.stats.crit_chance}`\n"
 		general_stats += f"Times hit: `{self.stats.num_been_hit}`"
 
-		embed.add_field(name="Throws:", value=throw_stats, inline=True)
-		embed.add_field(name="Snowballs:", value=snowball_stats, inline=True)
-		embed.add_field(name="Stats:", value=general_stats, inline=True)
+		rival_stats = ""
+		top_hit_by = self.stats.get_top_hit_by()
+		if top_hit_by:
+			rival_stats += "Hit most by: " + ", ".join(f"<@{member_id}> `{count}`" for member_id, count in top_hit_by)
 
-		if include_xp_stats:
-			xp_stats = f"Level: `{self.stats.level}/{self.stats.TOTAL_LEVELS}`\n"
+		top_has_hit = self.stats.get_top_has_hit()
+		if top_has_hit:
+			rival_stats += "\nHit the most: " + ", ".join(f"<@{member_id}> `{count}`" for member_id, count in top_has_hit)
 
-			if self.stats.level < self.stats.TOTAL_LEVELS:
-				xp_stats += f"XP: " + xp_bar(self.stats.xp, self.stats.xp_to_next_level)
-				xp_stats += f" (`{self.stats.xp}/{self.stats.xp_to_next_level}`)"
+		xp_stats = f"Level: `{self.stats.level}/{self.stats.TOTAL_LEVELS}`\n"
 
-			embed.add_field(name="Level", value=xp_stats, inline=False)
+		if self.stats.level < self.stats.TOTAL_LEVELS:
+			xp_stats += f"XP: " + xp_bar(self.stats.xp, self.stats.xp_to_next_level)
+			xp_stats += f" (`{self.stats.xp}/{self.stats.xp_to_next_level}`)"
 
-	async def collect(self, ctx: commands.Context):
-		if self.last_collect_time is None or self.stats.can_collect(self.last_collect_time, self.team.current_stage.cooldown_reduction_percent):
-			if self.stats.add_snowball():
-				self.last_collect_time = time.time()
+		fields = [
+			("Throws:", throw_stats, True),
+			("Snowballs:", snowball_stats, True),
+			("Stats:", general_stats, True)
+		]
 
-				embed = discord.Embed(
-					title=f"{self.member.name} collected a snowball",
-					description=f"{self.member.mention} are up to `{self.stats.num_snowballs}` balls",
-					color=COLLECT_COLOR
-				)
+		if rival_stats:
+			fields.append(("Rivals:", rival_stats.strip(), False))
 
-				await ctx.reply(embed=embed, allowed_mentions=NO_PING)
-			else:
-				await ctx.reply(f"{self.member.mention} is full", allowed_mentions=NO_PING)
+		fields.append(("Level", xp_stats, False))
+
+		return fields
+
+	def try_collect(self) -> CollectResult:
+		now = time.time()
+
+		result = game.collect(self.stats, self.last_collect_time, self.team.current_stage.cooldown_reduction_percent, now)
+		if result.collected:
+			self.last_collect_time = now
+			metrics.increment("collects")
+		elif result.cooldown_remaining is not None:
+			metrics.increment("collect_cooldown_rejections")
+
+		return result
+
+	@metrics.timed("discord.reply_collect")
+	async def reply_collect(self, ctx: commands.Context, result: CollectResult):
+		if result.collected:
+			embed = discord.Embed(
+				title=f"{self.member.name} collected a snowball",
+				description=f"{self.member.mention} are up to `{result.num_snowballs}` balls",
+				color=COLLECT_COLOR
+			)
+
+			await outbox.reply(ctx, embed=embed, allowed_mentions=NO_PING)
+		elif result.cooldown_remaining is None:
+			await outbox.reply(ctx, f"{self.member.mention} is full", allowed_mentions=NO_PING, priority=Priority.COSMETIC)
 		else:
-			await ctx.reply(
-				f"Cooldown has `{self.stats.get_collect_cooldown(
-					self.last_collect_time,
-					self.team.current_stage.cooldown_reduction_percent
-				)}` seconds remaining",
+			await outbox.reply(
+				ctx,
+				f"Cooldown has `{result.cooldown_remaining}` seconds remaining",
 				ephemeral=True,
-				delete_after=3
+				delete_after=3,
+				priority=Priority.COSMETIC
 			)
-			await ctx.message.delete(delay=3)
 
-	async def throw(self, ctx: commands.Context, target: "Player") -> bool:
-		if self.stats.num_snowballs == 0:
-			await ctx.reply(f"{self.member.mention} doesn't have any balls!", delete_after=3)
-			await ctx.message.delete(delay=3)
-			return False
+			# Slash commands don't leave a message behind
+			if ctx.interaction is None:
+				await ctx.message.delete(delay=3)
 
-		is_hit, is_crit = self.stats.throw(target, self.team.current_stage.crit_bonus_percentage)
+	def try_throw(self, target: "Player") -> ThrowResult | None:
+		result = game.throw(self.stats, target.stats, self.team.current_stage, target.team)
 
-		balls_remaining_message = f"You have `{self.stats.num_snowballs}` balls remaining"
+		if result is not None:
+			metrics.increment("throws")
+			metrics.increment("hits", result.is_hit)
+			metrics.increment("crits", result.is_crit)
 
-		if is_hit:
-			target.stats.hit(is_crit, self)
-			team_response = target.team.hit_player_on_team(is_crit)
-			if team_response == 2:  # Game over
-				return True
+		return result
 
-			add_xp = random.randint(3, 5) + self.team.current_stage.xp_bonus
-			if is_crit:
-				add_xp += random.randint(2, 3)
+	@metrics.timed("discord.reply_throw")
+	async def reply_throw(self, ctx: commands.Context, target: "Player", result: ThrowResult | None):
+		# Only uses the state captured in the result, as the game state can change while waiting on Discord
+		if result is None:
+			await outbox.reply(ctx, f"{self.member.mention} doesn't have any balls!", ephemeral=True, delete_after=3, priority=Priority.COSMETIC)
 
-			leveled_up = self.stats.add_xp(add_xp)
+			if ctx.interaction is None:
+				await ctx.message.delete(delay=3)
+			return
 
+		if feed.is_feed_channel(ctx.channel.id):
+			feed.add_throw(ctx.channel, self, target, result)
+
+			reaction = (CRIT_REACTION if result.is_crit else HIT_REACTION) if result.is_hit else MISS_REACTION
+
+			# There's no message to react to with slash commands
+			if ctx.interaction is None:
+				await ctx.message.add_reaction(reaction)
+			else:
+				await ctx.reply(reaction, ephemeral=True)
+			return
+
+		balls_remaining_message = f"You have `{result.num_snowballs}` balls remaining"
+
+		if result.is_hit:
 			message = ""
-			if is_crit:
+			if result.is_crit:
 				message += "Critical Hit!\n"
 			message += f"{self.member.mention} hit {target.member.mention}"
-			if is_crit:
+			if result.is_crit:
 				message += " and made them lose their balls!"
 			message += "!\n" + balls_remaining_message
-			message += f"\nGained {add_xp} xp."
+			message += f"\nGained {result.xp_gained} xp."
 
-			embed = discord.Embed(
+			# Everything the hit caused goes out as a single message
+			embeds = [discord.Embed(
 				title=f"{random.choice(("Splat", "Plop", "Thwack", "Smack", "Fwhap"))}!!",
 				description=message,
-				color=CRITICAL_HIT_COLOR if is_crit else HIT_COLOR
-			)
+				color=CRITICAL_HIT_COLOR if result.is_crit else HIT_COLOR
+			)]
 
-			await ctx.reply(
-				embed=embed,
-				allowed_mentions=NO_PING,
-			)
-
-			if leveled_up:
-				level_up_embed = discord.Embed(
+			if result.leveled_up:
+				embeds.append(discord.Embed(
 					title=f"{self.member.name} has leveled up!",
-					description=f"{self.member.mention} is now level `{self.stats.level}`.",
+					description=f"{self.member.mention} is now level `{result.level}`.",
 					color=LEVEL_UP_COLOR
-				)
-				await ctx.reply(embed=level_up_embed, allowed_mentions=NO_PING)
+				))
 
-			if team_response:
-				await target.team.send_team_level_up_message(ctx)
+			if result.team_response:
+				embeds.append(result.target_team.level_up_embed(result.target_team_stage))
+
+			await outbox.reply(
+				ctx,
+				embeds=embeds,
+				allowed_mentions=NO_PING,
+				priority=Priority.GAME if result.team_response else Priority.REPLY
+			)
 
 		else:
 			embed = discord.Embed(
@@ -146,6 +213,4 @@ class Player:
 				color=MISS_COLOR
 			)
 
-			await ctx.reply(embed=embed, allowed_mentions=NO_PING)
-
-		return False
+			await outbox.reply(ctx, embed=embed, allowed_mentions=NO_PING)
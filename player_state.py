@@ -0,0 +1,385 @@
+"""
+Player stats and the rules for changing them, without any storage.
+
+`PlayerStats` adds the event log and the stats store on top, and `simulate` uses
+`PlayerState` directly so matches don't touch either.
+"""
+
+import heapq
+
+
+class PlayerState:
+	"""
+	Every change ends in `_changed`, with the event that describes it
+	"""
+
+	__slots__ = (
+		"_member_id", "_team_id", "_active",
+		"_level", "_xp",
+		"_snowball_count", "_max_snowballs", "_collect_cooldown_secs", "_accuracy_percentage", "_crit_percentage",
+		"_num_thrown", "_num_hits", "_num_been_hit", "_num_been_crit_hit",
+		"_hit_by", "_has_hit", "_top_hit_by", "_top_has_hit",
+		"_version"
+	)
+
+	TOTAL_LEVELS = 7
+	# Number of members kept ranked in _top_hit_by and _top_has_hit
+	TOP_RIVALS = 3
+	_XP_TO_NEXT_LEVEL = (30, 40, 45, 50, 60, 80)
+	_STATS_FOR_LEVEL = {
+		1: {
+			"max_snowballs": 3,
+			"collect_cooldown": 30,
+			"accuracy": 60,
+			"crit": 30,
+		},
+		2: {
+			"max_snowballs": 4,
+			"collect_cooldown": 25,
+			"accuracy": 65,
+			"crit": 35,
+		},
+		3: {
+			"max_snowballs": 5,
+			"collect_cooldown": 20,
+			"accuracy": 70,
+			"crit": 40,
+		},
+		4: {
+			"max_snowballs": 6,
+			"collect_cooldown": 15,
+			"accuracy": 75,
+			"crit": 45,
+		},
+		5: {
+			"max_snowballs": 7,
+			"collect_cooldown": 13,
+			"accuracy": 80,
+			"crit": 50,
+		},
+		6: {
+			"max_snowballs": 8,
+			"collect_cooldown": 10,
+			"accuracy": 85,
+			"crit": 55,
+		},
+		7: {
+			"max_snowballs": 10,
+			"collect_cooldown": 5,
+			"accuracy": 90,
+			"crit": 65,
+		}
+	}
+
+	def __init__(self, member_id: int):
+		# Sanity checks
+		if len(self._XP_TO_NEXT_LEVEL) != self.TOTAL_LEVELS - 1:
+			raise ValueError("Incorrect number of levels for _XP_TO_NEXT_LEVEL")
+		if len(self._STATS_FOR_LEVEL) != self.TOTAL_LEVELS:
+			raise ValueError("Incorrect number of levels for _STATS_FOR_LEVEL")
+
+		self._member_id = member_id
+		self._team_id = 0
+		self._active = False
+
+		self._level = 1
+		self._xp = 0
+
+		self._snowball_count = 0
+
+		self._max_snowballs = 3
+		self._collect_cooldown_secs = 30
+		self._accuracy_percentage = 60
+		self._crit_percentage = 30
+
+		self._num_thrown = 0
+		self._num_hits = 0
+		self._num_been_hit = 0
+		self._num_been_crit_hit = 0
+
+		self._hit_by: dict[int, int] = {}
+		self._has_hit: dict[int, int] = {}
+
+		# [member_id, count] of the TOP_RIVALS highest counts in _hit_by and _has_hit, highest first
+		# and ties to the lowest id. Kept up to date as hits come in, so reading them doesn't scan the maps
+		self._top_hit_by: list[list[int]] = []
+		self._top_has_hit: list[list[int]] = []
+
+		self._version = 0
+
+	@staticmethod
+	def default_data() -> dict:
+		data = {
+			"team_id": 0,
+			"active": False,
+			"level": 1,
+			"xp": 0,
+			"snowball_count": 0,
+			"num_thrown": 0,
+			"num_hits": 0,
+			"num_been_hit": 0,
+			"num_been_crit_hit": 0,
+			"hit_by": {},
+			"has_hit": {}
+		}
+
+		data.update(PlayerState._STATS_FOR_LEVEL[1])
+
+		return data
+
+	def to_data(self) -> dict:
+		return {
+			"team_id": self._team_id,
+			"active": self._active,
+
+			"level": self._level,
+			"xp": self._xp,
+
+			"snowball_count": self._snowball_count,
+			"max_snowballs": self._max_snowballs,
+			"collect_cooldown": self._collect_cooldown_secs,
+			"accuracy": self._accuracy_percentage,
+			"crit": self._crit_percentage,
+
+			"num_thrown": self._num_thrown,
+			"num_hits": self._num_hits,
+			"num_been_hit": self._num_been_hit,
+			"num_been_crit_hit": self._num_been_crit_hit,
+
+			"hit_by": dict(self._hit_by),
+			"has_hit": dict(self._has_hit)
+		}
+
+	def load(self, data: dict):
+		self._version += 1
+
+		self._team_id = data["team_id"]
+		self._active = data["active"]
+
+		self._level = data["level"]
+		self._xp = data["xp"]
+
+		self._snowball_count = data["snowball_count"]
+		self._max_snowballs = data["max_snowballs"]
+		self._collect_cooldown_secs = data["collect_cooldown"]
+		self._accuracy_percentage = data["accuracy"]
+		self._crit_percentage = data["crit"]
+
+		self._num_thrown = data["num_thrown"]
+		self._num_hits = data["num_hits"]
+		self._num_been_hit = data["num_been_hit"]
+		self._num_been_crit_hit = data["num_been_crit_hit"]
+
+		self._hit_by = {int(key): value for key, value in data["hit_by"].items()}
+		self._has_hit = {int(key): value for key, value in data["has_hit"].items()}
+
+		self._top_hit_by = self._rank_top(self._hit_by)
+		self._top_has_hit = self._rank_top(self._has_hit)
+
+	def _changed(self, event_type: str, **fields):
+		self._version += 1
+
+	@property
+	def version(self) -> int:
+		return self._version
+
+	@property
+	def member_id(self) -> int:
+		return self._member_id
+
+	def set_active(self, value: bool = True):
+		self._active = value
+		self._changed("active", active=value)
+
+	def set_team(self, team_id: int):
+		self._team_id = team_id
+		self._changed("team", team=team_id)
+
+	@property
+	def team_id(self) -> int:
+		return self._team_id
+
+	@property
+	def active(self) -> bool:
+		return self._active
+
+	@property
+	def level(self) -> int:
+		return self._level
+
+	@property
+	def xp(self) -> int:
+		return self._xp
+
+	@property
+	def xp_to_next_level(self) -> int:
+		return self._XP_TO_NEXT_LEVEL[self._level - 1]
+
+	@property
+	def num_snowballs(self) -> int:
+		return self._snowball_count
+
+	@property
+	def max_snowballs(self) -> int:
+		return self._max_snowballs
+
+	@property
+	def collect_cooldown(self) -> int:
+		return self._collect_cooldown_secs
+
+	@property
+	def accuracy(self) -> int:
+		return self._accuracy_percentage
+
+	@property
+	def crit_chance(self) -> int:
+		return self._crit_percentage
+
+	@property
+	def num_thrown(self) -> int:
+		return self._num_thrown
+
+	@property
+	def num_hits(self) -> int:
+		return self._num_hits
+
+	@property
+	def num_been_hit(self) -> int:
+		return self._num_been_hit
+
+	@property
+	def num_been_crit_hit(self) -> int:
+		return self._num_been_crit_hit
+
+	@staticmethod
+	def _rank_key(member_id: int, count: int) -> tuple[int, int]:
+		# Ties go to the lowest id, which doesn't depend on the order hits came in or were loaded
+		return count, -member_id
+
+	@classmethod
+	def _rank_top(cls, counts: dict[int, int]) -> list[list[int]]:
+		return [[member_id, count] for member_id, count in heapq.nlargest(cls.TOP_RIVALS, counts.items(), key=lambda e: cls._rank_key(*e))]
+
+	@classmethod
+	def _update_top(cls, top: list[list[int]], member_id: int, count: int):
+		"""
+		Moves a member up `top` after their count went up by one
+		"""
+
+		for index, entry in enumerate(top):
+			if entry[0] == member_id:
+				entry[1] = count
+				break
+		else:
+			# Counts only go up by one, so anyone outside of top has to pass the lowest in it
+			if len(top) == cls.TOP_RIVALS and cls._rank_key(member_id, count) < cls._rank_key(*top[-1]):
+				return
+
+			top.append([member_id, count])
+			if len(top) > cls.TOP_RIVALS:
+				top.pop(-2)
+			index = len(top) - 1
+
+		while index > 0 and cls._rank_key(*top[index - 1]) < cls._rank_key(member_id, count):
+			top[index - 1], top[index] = top[index], top[index - 1]
+			index -= 1
+
+	def get_hit_by_most(self) -> tuple[int, int]:
+		if self._top_hit_by:
+			return self._top_hit_by[0][0], self._top_hit_by[0][1]
+
+		return 0, 0
+
+	def get_has_hit_most(self) -> tuple[int, int]:
+		if self._top_has_hit:
+			return self._top_has_hit[0][0], self._top_has_hit[0][1]
+
+		return 0, 0
+
+	def get_top_hit_by(self) -> list[tuple[int, int]]:
+		"""
+		:return: (member_id, times hit by them) for up to TOP_RIVALS members, most first
+		"""
+
+		return [(member_id, count) for member_id, count in self._top_hit_by]
+
+	def get_top_has_hit(self) -> list[tuple[int, int]]:
+		"""
+		:return: (member_id, times hit them) for up to TOP_RIVALS members, most first
+		"""
+
+		return [(member_id, count) for member_id, count in self._top_has_hit]
+
+	def add_xp(self, amount: int) -> bool:
+		if self._level >= self.TOTAL_LEVELS:
+			return False
+
+		self._xp += amount
+		self._changed("xp", amount=amount)
+
+		if self._xp >= self.xp_to_next_level:
+			self._xp -= self.xp_to_next_level
+
+			return self._level_up()
+
+		return False
+
+	def _level_up(self) -> bool:
+		if self._level >= self.TOTAL_LEVELS:
+			return False
+
+		self._level += 1
+
+		level_stats = self._STATS_FOR_LEVEL[self._level]
+		self._max_snowballs = level_stats["max_snowballs"]
+		self._collect_cooldown_secs = level_stats["collect_cooldown"]
+		self._accuracy_percentage = level_stats["accuracy"]
+		self._crit_percentage = level_stats["crit"]
+
+		# Only for the record, replaying the xp levels up again
+		self._changed("level_up", level=self._level)
+
+		return True
+
+	def hit(self, is_crit: bool, thrower_id: int):
+		self._num_been_hit += 1
+
+		if thrower_id not in self._hit_by:
+			self._hit_by[thrower_id] = 0
+
+		self._hit_by[thrower_id] += 1
+		self._update_top(self._top_hit_by, thrower_id, self._hit_by[thrower_id])
+
+		if is_crit:
+			self._snowball_count = 0
+			self._num_been_crit_hit += 1
+
+		self._changed("hit", by=thrower_id, crit=is_crit)
+
+	def throw(self, target_id: int, is_hit: bool):
+		self._snowball_count -= 1
+		self._num_thrown += 1
+
+		if is_hit:
+			self._num_hits += 1
+
+			# Set has hit
+			if target_id not in self._has_hit:
+				self._has_hit[target_id] = 0
+
+			self._has_hit[target_id] += 1
+			self._update_top(self._top_has_hit, target_id, self._has_hit[target_id])
+
+		self._changed("throw", target=target_id, hit=is_hit)
+
+	def add_snowball(self) -> bool:
+		if self._snowball_count < self._max_snowballs:
+			self._snowball_count += 1
+			self._changed("collect")
+			return True
+
+		return False
+
+	def remove_snowball(self):
+		self._snowball_count -= 1
+		self._changed("drop")
@@ -0,0 +1,127 @@
+"""
+Compact binary encoding of player stats records, the dicts from `PlayerStats.to_data`.
+
+A record starts with a fixed header, packed with struct:
+
+	version (u8) | flags (u8, bit 0 = active)
+
+followed by the numbers in `_FIELDS` order as unsigned LEB128 varints, so the small
+counts most players have take one byte each. Then the `hit_by` and `has_hit` maps, each
+as a varint entry count followed by the member ids (u64) and then their counts (u32).
+The maps are packed with a single struct call each rather than a varint per entry, as
+looping over them byte by byte in Python is slower than json for a few dozen opponents.
+
+Any change to the layout bumps the header version, so records from another layout
+are rejected instead of misread.
+"""
+
+import struct
+
+VERSION = 1
+
+_HEADER = struct.Struct("<BB")
+_ACTIVE_FLAG = 0b1
+
+# Order of the varint fields after the header, never reorder these within a version
+_FIELDS = (
+	"team_id",
+	"level", "xp",
+	"snowball_count", "max_snowballs", "collect_cooldown", "accuracy", "crit",
+	"num_thrown", "num_hits", "num_been_hit", "num_been_crit_hit",
+	"seq"
+)
+
+
+def _write_varint(out: bytearray, value: int):
+	if value < 0:
+		raise ValueError(f"Can't encode negative value {value}")
+
+	while value > 0x7F:
+		out.append((value & 0x7F) | 0x80)
+		value >>= 7
+
+	out.append(value)
+
+
+def _read_varint(data: bytes, offset: int) -> tuple[int, int]:
+	"""
+	:return: (value, offset after it)
+	"""
+
+	byte = data[offset]
+	offset += 1
+
+	# Most values fit in one byte
+	if byte < 0x80:
+		return byte, offset
+
+	value = byte & 0x7F
+	shift = 7
+	while True:
+		byte = data[offset]
+		offset += 1
+
+		value |= (byte & 0x7F) << shift
+		if byte < 0x80:
+			return value, offset
+
+		shift += 7
+
+
+def _write_counts(out: bytearray, counts: dict):
+	_write_varint(out, len(counts))
+
+	# Ids from json are still strings
+	out += struct.pack(f"<{len(counts)}Q{len(counts)}I", *map(int, counts.keys()), *counts.values())
+
+
+def _read_counts(data: bytes, offset: int) -> tuple[dict[int, int], int]:
+	num_entries, offset = _read_varint(data, offset)
+
+	if num_entries == 0:
+		return {}, offset
+
+	values = struct.unpack_from(f"<{num_entries}Q{num_entries}I", data, offset)
+	offset += num_entries * 12
+
+	return dict(zip(values[:num_entries], values[num_entries:])), offset
+
+
+def encode_record(data: dict) -> bytes:
+	out = bytearray(_HEADER.pack(VERSION, _ACTIVE_FLAG if data["active"] else 0))
+
+	for field in _FIELDS:
+		# Records from before the event log have no seq
+		_write_varint(out, data.get(field, 0))
+
+	_write_counts(out, data["hit_by"])
+	_write_counts(out, data["has_hit"])
+
+	return bytes(out)
+
+
+def decode_record(data: bytes) -> dict:
+	"""
+	:raises ValueError: If the data is truncated or from an unknown version
+	"""
+
+	try:
+		version, flags = _HEADER.unpack_from(data)
+		if version != VERSION:
+			raise ValueError(f"Unknown player record version {version}")
+
+		record = {"active": bool(flags & _ACTIVE_FLAG)}
+
+		offset = _HEADER.size
+		for field in _FIELDS:
+			record[field], offset = _read_varint(data, offset)
+
+		record["hit_by"], offset = _read_counts(data, offset)
+		record["has_hit"], offset = _read_counts(data, offset)
+	except (struct.error, IndexError):
+		raise ValueError("Truncated player record")
+
+	if offset != len(data):
+		raise ValueError("Trailing data after player record")
+
+	return record
@@ -0,0 +1,115 @@
+"""
+Plays out whole matches between synthetic players using the game rules, without Discord.
+
+Run with `python simulate.py [num_players] [num_matches]`
+"""
+
+import random
+import sys
+import time
+from dataclasses import dataclass
+
+import game
+from game import Snowman
+from player_state import PlayerState
+
+# Chance each simulated second that a player with snowballs throws one, instead of collecting
+THROW_CHANCE = 0.5
+
+
+@dataclass(slots=True)
+class MatchResult:
+	winning_team: int
+	duration: int  # Simulated seconds
+	num_actions: int  # Throws and collect attempts
+	num_throws: int
+	num_collects: int
+
+
+def check_teams(teams: tuple[Snowman, Snowman], team_members: tuple[list[PlayerState], list[PlayerState]]):
+	"""
+	Checks that each snowman's hit counts match its players' stats
+	"""
+
+	for team_index, (team, members) in enumerate(zip(teams, team_members)):
+		problems = team.check_hits(sum(stats.num_been_hit for stats in members), sum(stats.num_been_crit_hit for stats in members))
+		if problems:
+			raise AssertionError(f"Team {team_index} drifted: " + ", ".join(problems))
+
+
+def simulate_match(num_players: int, rng: random.Random) -> MatchResult:
+	"""
+	Players alternate between team 0 and 1. Every simulated second each player either
+	throws at a random member of the other team, or tries to collect.
+	"""
+
+	if num_players < 2:
+		raise ValueError("Need at least 2 players for a match")
+
+	players = [PlayerState(member_id) for member_id in range(num_players)]
+	team_members = (players[0::2], players[1::2])
+	teams = (Snowman(), Snowman())
+
+	last_collect_times: list[float | None] = [None] * num_players
+
+	num_actions = 0
+	num_throws = 0
+	num_collects = 0
+
+	now = 0
+	while True:
+		now += 1
+
+		for index, stats in enumerate(players):
+			team_index = index % 2
+			team = teams[team_index]
+
+			num_actions += 1
+
+			if stats.num_snowballs > 0 and rng.random() < THROW_CHANCE:
+				other_team_index = 1 - team_index
+				target = rng.choice(team_members[other_team_index])
+
+				result = game.throw(stats, target, team.current_stage, teams[other_team_index], rng)
+				num_throws += 1
+
+				if result.team_response == 2:  # Game over
+					check_teams(teams, team_members)
+					return MatchResult(team_index, now, num_actions, num_throws, num_collects)
+			else:
+				result = game.collect(stats, last_collect_times[index], team.current_stage.cooldown_reduction_percent, now)
+
+				if result.collected:
+					last_collect_times[index] = now
+					num_collects += 1
+
+
+def main():
+	num_players = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+	num_matches = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+	rng = random.Random()
+
+	wins = [0, 0]
+	total_duration = 0
+	total_actions = 0
+	total_throws = 0
+
+	start_time = time.perf_counter()
+	for _ in range(num_matches):
+		result = simulate_match(num_players, rng)
+
+		wins[result.winning_team] += 1
+		total_duration += result.duration
+		total_actions += result.num_actions
+		total_throws += result.num_throws
+
+	elapsed = time.perf_counter() - start_time
+
+	print(f"{num_matches} matches with {num_players} players in {elapsed:.2f}s ({total_actions / elapsed:,.0f} actions/s, {total_throws / elapsed:,.0f} throws/s)")
+	print(f"Team 0 won {wins[0]}, team 1 won {wins[1]}")
+	print(f"Average match: {total_duration / num_matches:.0f} simulated secs, {total_throws / num_matches:.0f} throws")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,266 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from consts import SAVE_INTERVAL_SECS, SAVE_DIRTY_THRESHOLD, SAVE_QUEUE_SIZE, EVENT_LOG_FLUSH_SECS
+from event_log import event_log
+from storage import StatsStorage, create_storage
+
+if TYPE_CHECKING:
+	from player_stats import PlayerStats
+
+
+class StatsStore:
+	"""
+	Write-behind store for player stats.
+
+	Mutating a `PlayerStats` only marks it as dirty. Dirty stats are written out
+	together by `aflush`, which runs every `flush_interval` seconds, or earlier once
+	`flush_threshold` players are dirty.
+
+	Records are persisted through `storage`, and all storage I/O happens on a
+	dedicated I/O thread. At most `queue_size` batches can be waiting on it at once,
+	after which `aflush` waits for room instead of piling up more writes.
+
+	The event log is written on the same thread, every `log_flush_interval` seconds
+	and ahead of each batch of records. Log writes are queued as soon as the events are
+	taken, so the log stays in order and each checkpoint knows exactly where its events end.
+	"""
+
+	def __init__(
+			self,
+			storage: StatsStorage,
+			flush_interval: float = SAVE_INTERVAL_SECS,
+			flush_threshold: int = SAVE_DIRTY_THRESHOLD,
+			queue_size: int = SAVE_QUEUE_SIZE,
+			log_flush_interval: float = EVENT_LOG_FLUSH_SECS
+	):
+		self.storage = storage
+
+		self.flush_interval = flush_interval
+		self.flush_threshold = flush_threshold
+		self.log_flush_interval = log_flush_interval
+
+		self._records: dict[int, dict] = {}
+		self._dirty: dict[int, "PlayerStats"] = {}
+		self._flush_requested = asyncio.Event()
+
+		self._io_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stats-io")
+		self._queue_slots = asyncio.Semaphore(queue_size)
+		# Submits that haven't finished writing yet, so aflush can wait on them
+		self._in_flight: set[asyncio.Task] = set()
+
+		# Metrics
+		self.queue_depth = 0
+		self.num_flushes = 0
+		self.last_flush_latency = 0.0
+		self.total_flush_latency = 0.0
+
+	@property
+	def num_dirty(self) -> int:
+		return len(self._dirty)
+
+	def metrics(self) -> dict[str, float]:
+		return {
+			"dirty": self.num_dirty,
+			"queue_depth": self.queue_depth,
+			"flushes": self.num_flushes,
+			"last_flush_latency": self.last_flush_latency,
+			"avg_flush_latency": self.total_flush_latency / self.num_flushes if self.num_flushes != 0 else 0.0
+		}
+
+	def is_dirty(self, stats: "PlayerStats") -> bool:
+		return stats.member_id in self._dirty
+
+	def get_pending(self, member_id: int) -> "PlayerStats | None":
+		"""
+		:return: The member's stats if they have changes that haven't been flushed yet
+		"""
+
+		return self._dirty.get(member_id)
+
+	def mark_dirty(self, stats: "PlayerStats"):
+		self._dirty[stats.member_id] = stats
+
+		if len(self._dirty) >= self.flush_threshold:
+			self._flush_requested.set()
+
+	def request_flush(self):
+		"""
+		Has the flusher write out every dirty player now, instead of waiting for the interval
+		"""
+
+		self._flush_requested.set()
+
+	@property
+	def num_records(self) -> int:
+		return len(self._records)
+
+	@property
+	def max_seq(self) -> int:
+		"""
+		Highest event log sequence number in the stored records
+		"""
+
+		return max((record.get("seq", 0) for record in self._records.values()), default=0)
+
+	async def aload_all(self):
+		"""
+		Loads every stored record in one go, so players can be created without touching storage
+		"""
+
+		self._records = await asyncio.get_running_loop().run_in_executor(self._io_thread, self.storage.read_all)
+
+		if self.storage.invalid_ids:
+			print(f"Skipped {len(self.storage.invalid_ids)} unreadable player records, they start over from the event log")
+
+	def get_record(self, member_id: int) -> dict | None:
+		"""
+		:return: The member's last flushed record, or None for a new player
+		"""
+
+		return self._records.get(member_id)
+
+	def _snapshot(self, dirty: dict[int, "PlayerStats"]) -> dict[int, dict]:
+		# Snapshot on the event loop, so the I/O thread never sees a record mid-mutation
+		records = {member_id: stats.to_data() for member_id, stats in dirty.items()}
+		self._records.update(records)
+
+		return records
+
+	def _write_records(self, records: dict[int, dict], checkpoint: tuple[int, int] | None):
+		self.storage.write_many(records)
+
+		if checkpoint is not None:
+			event_log.write_checkpoint(*checkpoint)
+
+	def _submit(self, records: dict[int, dict], checkpoint: bool = False) -> asyncio.Task:
+		"""
+		Starts writing `records`, in a task of its own so it still finishes if the caller is cancelled
+
+		:param checkpoint: Whether `records` holds every dirty player, so that the
+		snapshots include every logged event once it's written
+		"""
+
+		# Taken along with the records so they cover the same events, and written first,
+		# so the log is never behind the records
+		events, seq = event_log.take()
+		events_written = asyncio.get_running_loop().run_in_executor(self._io_thread, event_log.write, events)
+
+		task = asyncio.create_task(self._write(records, events_written, seq, checkpoint))
+		self._in_flight.add(task)
+		task.add_done_callback(self._in_flight.discard)
+
+		return task
+
+	async def _write(self, records: dict[int, dict], events_written: asyncio.Future, seq: int, checkpoint: bool):
+		loop = asyncio.get_running_loop()
+
+		async with self._queue_slots:
+			self.queue_depth += 1
+			start_time = time.perf_counter()
+
+			try:
+				offset = await events_written
+				await loop.run_in_executor(self._io_thread, self._write_records, records, (seq, offset) if checkpoint else None)
+			finally:
+				self.queue_depth -= 1
+
+				self.num_flushes += 1
+				self.last_flush_latency = time.perf_counter() - start_time
+				self.total_flush_latency += self.last_flush_latency
+
+	@staticmethod
+	async def _wait_for(tasks: set[asyncio.Task]):
+		# Failures are raised to whoever submitted them, this only waits
+		if tasks:
+			await asyncio.wait(tasks)
+
+	async def asave(self, stats: "PlayerStats"):
+		self._dirty.pop(stats.member_id, None)
+
+		try:
+			await asyncio.shield(self._submit(self._snapshot({stats.member_id: stats})))
+		except BaseException:
+			self._dirty.setdefault(stats.member_id, stats)
+			raise
+
+	async def aflush_events(self):
+		"""
+		Writes out the event log without waiting for the next flush
+		"""
+
+		events, _ = event_log.take()
+		if events:
+			await asyncio.get_running_loop().run_in_executor(self._io_thread, event_log.write, events)
+
+	async def aflush(self):
+		"""
+		Writes out every dirty player, and waits for any earlier flushes still being written
+		"""
+
+		earlier = set(self._in_flight)
+
+		if len(self._dirty) == 0:
+			await self.aflush_events()
+			await self._wait_for(earlier)
+			return
+
+		dirty = self._dirty
+		self._dirty = {}
+
+		try:
+			await asyncio.shield(self._submit(self._snapshot(dirty), checkpoint=True))
+		except BaseException:
+			# Requeue anything that wasn't dirtied again in the meantime, so the next flush retries it.
+			# Also on cancellation, as the write may not get to finish before shutting down
+			for member_id, stats in dirty.items():
+				self._dirty.setdefault(member_id, stats)
+
+			raise
+
+		await self._wait_for(earlier)
+
+	def flush(self):
+		"""
+		Blocking flush, for when the event loop is no longer running (e.g. on shutdown)
+		"""
+
+		dirty = self._dirty
+		self._dirty = {}
+
+		events, seq = event_log.take()
+		offset = event_log.write(events)
+		self._write_records(self._snapshot(dirty), (seq, offset))
+
+	def close(self):
+		# Lets the last writes finish first, so they don't race the final flush for the same files
+		self._io_thread.shutdown(wait=True)
+		self.flush()
+
+		self.storage.close()
+		event_log.close()
+
+	async def run(self):
+		last_flush_time = time.monotonic()
+
+		while True:
+			try:
+				await asyncio.wait_for(self._flush_requested.wait(), timeout=min(self.flush_interval, self.log_flush_interval))
+			except asyncio.TimeoutError:
+				pass
+
+			try:
+				if self._flush_requested.is_set() or time.monotonic() - last_flush_time >= self.flush_interval:
+					self._flush_requested.clear()
+					last_flush_time = time.monotonic()
+
+					await self.aflush()
+				else:
+					await self.aflush_events()
+			except Exception as e:  # Keep the flusher alive, the failed records get retried next time
+				print(f"Failed to save player stats: {e}")
+
+
+store = StatsStore(create_storage())
@@ -0,0 +1,316 @@
+import abc
+import json
+import os
+import pathlib
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from consts import DATA_DIR, DATABASE_PATH, STORAGE_BACKEND, LOAD_BATCH_SIZE, LOAD_WORKERS
+from record_codec import encode_record, decode_record
+
+# Read once, os.umask can only be read by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def sync_dir(path: pathlib.Path):
+	"""
+	Makes renames into the directory durable
+	"""
+
+	fd = os.open(path, os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+
+def write_atomic(path: pathlib.Path, contents: str | bytes, sync: bool = True):
+	"""
+	Writes to a temporary file that then replaces `path`, so a crash mid-write
+	leaves either the old or the new contents and never a truncated file.
+
+	The contents are fsynced before the replace, so the new file is never empty after a
+	power loss either.
+
+	:param sync: Whether to also fsync the directory, so the replace itself is durable.
+	Callers writing many files can leave it out and sync_dir once at the end
+	"""
+
+	# Unique per write, so writers racing on the same path don't clobber each other's temp file
+	fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+	try:
+		with open(fd, "wb" if isinstance(contents, bytes) else "w") as file:
+			file.write(contents)
+			file.flush()
+			os.fsync(file.fileno())
+
+		# mkstemp creates the file as 0600, so keep the mode the file had, or would get from open()
+		try:
+			mode = os.stat(path).st_mode & 0o777
+		except FileNotFoundError:
+			mode = 0o666 & ~_UMASK
+		os.chmod(temp_path, mode)
+
+		os.replace(temp_path, path)
+	except BaseException:
+		try:
+			os.remove(temp_path)
+		except OSError:
+			pass
+
+		raise
+
+	if sync:
+		sync_dir(path.parent)
+
+
+# Keys every record needs to be loaded, records from before the event log have no "seq"
+RECORD_KEYS = frozenset((
+	"team_id", "active", "level", "xp",
+	"snowball_count", "max_snowballs", "collect_cooldown", "accuracy", "crit",
+	"num_thrown", "num_hits", "num_been_hit", "num_been_crit_hit",
+	"hit_by", "has_hit"
+))
+
+
+def is_valid_record(data) -> bool:
+	return isinstance(data, dict) and RECORD_KEYS <= data.keys()
+
+
+class StatsStorage(abc.ABC):
+	"""
+	Where player stats records live between runs.
+
+	Records are the plain dicts produced by `PlayerStats.to_data`, keyed by member id.
+	"""
+
+	# Members whose records couldn't be read by the last read_all, they're left out of it
+	invalid_ids: set[int] = set()
+
+	@abc.abstractmethod
+	def read_all(self) -> dict[int, dict]:
+		...
+
+	@abc.abstractmethod
+	def write_many(self, records: dict[int, dict]):
+		...
+
+	def close(self):
+		pass
+
+
+class JsonStorage(StatsStorage):
+	"""
+	One `<member_id>.json` file per member
+	"""
+
+	EXTENSION = ".json"
+
+	def __init__(self, data_dir: pathlib.Path = DATA_DIR):
+		self.data_dir = data_dir
+
+	@staticmethod
+	def encode(data: dict) -> str | bytes:
+		return json.dumps(data)
+
+	@staticmethod
+	def decode(contents: bytes) -> dict:
+		return json.loads(contents)
+
+	@classmethod
+	def _read_file(cls, file_path: str) -> dict | None:
+		"""
+		:return: None if the file is empty, corrupt or missing any of RECORD_KEYS,
+		after moving it aside to `<file>.corrupt`
+		"""
+
+		try:
+			with open(file_path, "rb") as file:
+				data = cls.decode(file.read())
+
+			if is_valid_record(data):
+				return data
+		except (OSError, ValueError):
+			pass
+
+		print(f"Corrupt player record {file_path}, moving it aside")
+		os.replace(file_path, file_path + ".corrupt")
+
+		return None
+
+	@classmethod
+	def _read_batch(cls, file_paths: list[str]) -> tuple[dict[int, dict], set[int]]:
+		records = {}
+		invalid_ids = set()
+		for file_path in file_paths:
+			member_id = int(os.path.basename(file_path)[:-len(cls.EXTENSION)])
+
+			data = cls._read_file(file_path)
+			if data is None:
+				invalid_ids.add(member_id)
+			else:
+				records[member_id] = data
+
+		return records, invalid_ids
+
+	def read_all(self) -> dict[int, dict]:
+		file_paths = []
+		for entry in os.scandir(self.data_dir):
+			if entry.name.endswith(self.EXTENSION):
+				# Anything not named after a member id isn't a record
+				if entry.name[:-len(self.EXTENSION)].isdigit():
+					file_paths.append(entry.path)
+			elif entry.name.endswith(".tmp"):
+				# Left behind by a crash mid-write, the record it was replacing is still there
+				os.remove(entry.path)
+		batches = [file_paths[i:i + LOAD_BATCH_SIZE] for i in range(0, len(file_paths), LOAD_BATCH_SIZE)]
+
+		records = {}
+		self.invalid_ids = set()
+		with ThreadPoolExecutor(max_workers=LOAD_WORKERS, thread_name_prefix="stats-load") as pool:
+			for batch_records, batch_invalid_ids in pool.map(self._read_batch, batches):
+				records.update(batch_records)
+				self.invalid_ids.update(batch_invalid_ids)
+
+		return records
+
+	def write_many(self, records: dict[int, dict]):
+		for member_id, data in records.items():
+			write_atomic(self.data_dir / f"{member_id}{self.EXTENSION}", self.encode(data), sync=False)
+
+		# Once for the whole batch, before the stats store checkpoints the event log past it
+		if records:
+			sync_dir(self.data_dir)
+
+
+class BinaryStorage(JsonStorage):
+	"""
+	One `<member_id>.bin` file per member, in the compact format from record_codec
+	"""
+
+	EXTENSION = ".bin"
+
+	@staticmethod
+	def encode(data: dict) -> bytes:
+		return encode_record(data)
+
+	@staticmethod
+	def decode(contents: bytes) -> dict:
+		return decode_record(contents)
+
+
+class SqliteStorage(StatsStorage):
+	"""
+	All members in a single SQLite table, with each flush written as one transaction
+	"""
+
+	def __init__(self, path: pathlib.Path = DATABASE_PATH):
+		self.path = path
+
+		# Used from both the event loop thread (startup) and the stats I/O thread
+		self._lock = threading.Lock()
+		self._connection = sqlite3.connect(path, check_same_thread=False)
+
+		with self._lock:
+			self._connection.execute("PRAGMA journal_mode=WAL")
+			# NORMAL can lose the last commits on a power loss, after the event log has been checkpointed past them
+			self._connection.execute("PRAGMA synchronous=FULL")
+			self._connection.execute("CREATE TABLE IF NOT EXISTS players (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+			self._connection.commit()
+
+	def read_all(self) -> dict[int, dict]:
+		with self._lock:
+			rows = self._connection.execute("SELECT id, data FROM players").fetchall()
+
+		# Rows are written in transactions so shouldn't be torn, but are checked the same as json files
+		records = {}
+		self.invalid_ids = set()
+		for member_id, data in rows:
+			try:
+				record = json.loads(data)
+			except ValueError:
+				record = None
+
+			if is_valid_record(record):
+				records[member_id] = record
+			else:
+				self.invalid_ids.add(member_id)
+
+		return records
+
+	def write_many(self, records: dict[int, dict]):
+		rows = [(member_id, json.dumps(data)) for member_id, data in records.items()]
+
+		with self._lock, self._connection:
+			self._connection.executemany(
+				"INSERT INTO players (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+				rows
+			)
+
+	def close(self):
+		with self._lock:
+			self._connection.close()
+
+
+class MemoryStorage(StatsStorage):
+	"""
+	Keeps records in memory only, for benchmarks and simulations
+	"""
+
+	def __init__(self, records: dict[int, dict] | None = None):
+		self.records = {} if records is None else dict(records)
+
+	def read_all(self) -> dict[int, dict]:
+		return dict(self.records)
+
+	def write_many(self, records: dict[int, dict]):
+		self.records.update(records)
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> StatsStorage:
+	if backend == "memory":
+		return MemoryStorage()
+	if backend == "json":
+		return JsonStorage()
+	if backend == "binary":
+		return BinaryStorage()
+	if backend == "sqlite":
+		return SqliteStorage()
+
+	raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def convert_storage(source: StatsStorage, destination: StatsStorage) -> int:
+	"""
+	Copies every record from one storage to another, such as between json and binary files.
+	Safe to run more than once, existing records are overwritten.
+
+	:return: Number of records copied
+	"""
+
+	records = source.read_all()
+	destination.write_many(records)
+
+	return len(records)
+
+
+def migrate_json_to_sqlite(data_dir: pathlib.Path = DATA_DIR, database_path: pathlib.Path = DATABASE_PATH) -> int:
+	"""
+	Copies every `data/*.json` record into the SQLite database.
+	Safe to run more than once, existing rows are overwritten.
+
+	:return: Number of records migrated
+	"""
+
+	storage = SqliteStorage(database_path)
+	num_records = convert_storage(JsonStorage(data_dir), storage)
+	storage.close()
+
+	return num_records
+
+
+if __name__ == "__main__":
+	print(f"Migrated {migrate_json_to_sqlite()} players to {DATABASE_PATH}")
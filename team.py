@@ -1,62 +1,327 @@
+import itertools
+from collections import OrderedDict
+from typing import Iterable, Iterator
+
 import discord
 from discord.ext import commands
 
-from consts import LEVEL_UP_COLOR
-from graphics import xp_bar
+from consts import LEVEL_UP_COLOR, IGNORED_MEMBERS, MAX_RESIDENT_PLAYERS, TEAM_STAGE_CURVE_ROTATION
+from event_log import event_log
+from game import Snowman, StageCurve, TeamStage, STAGE_CURVES, TEAM_CURVE, BASE_TEAM_CURVE
+from graphics import FieldCache, xp_bar
+from leaderboard import Leaderboard
+from outbox import outbox, Priority
 from player import Player
+from player_stats import PlayerStats
+from stats_store import store
 
 
 class TeamGroup:
-	def __init__(self):
-		self.players: dict[discord.Member, Player] = {}
+	"""
+	Every eligible guild member is registered on a team at startup, but their `Player`
+	is only created the first time they are referenced. Up to `max_resident_players`
+	players are kept around, after which the least recently used idle players with no
+	unsaved changes are dropped, to be recreated from the stats store when needed.
+	"""
+
+	def __init__(self, max_resident_players: int = MAX_RESIDENT_PLAYERS):
+		self.guild: discord.Guild | None = None
+
+		self.member_ids: set[int] = set()
+		# Members that have signed up, kept in sync by mark_member_active
+		self.active_ids: set[int] = set()
+
+		# Least recently used first
+		self.players: OrderedDict[int, Player] = OrderedDict()
+		self.max_resident_players = max_resident_players
 
 		self.teams: dict[int, "Team"] = {0: Team(0, allow_friendly_fire=True, base_team=True)}  # 0 is default team
 
-	def add_player(self, player: Player):
-		if player.member not in self.players:
-			self.players[player.member] = player
+		# Teams are created on the current match's curve, and keep it until they're empty again
+		self._stage_curves = itertools.cycle(STAGE_CURVES[name] for name in TEAM_STAGE_CURVE_ROTATION)
+		self.stage_curve: StageCurve = next(self._stage_curves)
+
+		# Each team also has its own
+		self.leaderboard = Leaderboard()
+
+		# Set once every member has been registered
+		self.ready = False
+
+	def load(self, guild: discord.Guild):
+		self.guild = guild
+
+		for member in guild.members:
+			if self.is_eligible(member):
+				self._register(member.id)
+
+	def start_next_match(self):
+		"""
+		Moves on to the next stage curve in TEAM_STAGE_CURVE_ROTATION, for teams created from now on
+		"""
+
+		self.stage_curve = next(self._stage_curves)
+
+	def _get_team(self, team_id: int) -> "Team":
+		if team_id not in self.teams:
+			self.teams[team_id] = Team(team_id, self.stage_curve)
+
+		return self.teams[team_id]
+
+	@staticmethod
+	def is_eligible(member: discord.Member) -> bool:
+		return not member.bot and member.name not in IGNORED_MEMBERS
+
+	def _get_stats(self, member_id: int) -> PlayerStats:
+		if member_id in self.players:
+			return self.players[member_id].stats
+
+		return store.get_pending(member_id) or PlayerStats(member_id)
+
+	def _peek(self, member_id: int, stat: str):
+		"""
+		Reads a stat without creating the player
+		"""
+
+		stats = self.players[member_id].stats if member_id in self.players else store.get_pending(member_id)
+		if stats is not None:
+			return getattr(stats, stat)
+
+		data = store.get_record(member_id)
+		if data is None:
+			data = PlayerStats.default_data()
 
-		if player.stats.team_id not in self.teams:
-			self.teams[player.stats.team_id] = Team(player.stats.team_id)
+		return data[stat]
 
-		self.teams[player.stats.team_id].add_player(player)
+	def _register(self, member_id: int):
+		self.member_ids.add(member_id)
+		if self._peek(member_id, "active"):
+			self.active_ids.add(member_id)
 
-	def remove_player(self, player: Player):
-		self.teams[player.stats.team_id].remove_player(player)
-		if len(self.teams[player.stats.team_id].players) == 0:
-			del self.teams[player.stats.team_id]
+		num_hits = self._peek(member_id, "num_hits")
+		self.leaderboard.update(member_id, num_hits)
+
+		self._get_team(self._peek(member_id, "team_id")).add_member(
+			member_id,
+			num_hits,
+			self._peek(member_id, "num_been_hit"),
+			self._peek(member_id, "num_been_crit_hit"),
+			member_id in self.active_ids
+		)
+
+	def _evict_idle_players(self):
+		num_to_evict = len(self.players) - self.max_resident_players
+		if num_to_evict <= 0:
+			return
+
+		evicted = []
+		for member_id, player in self.players.items():
+			if len(evicted) == num_to_evict:
+				break
+
+			if player.is_idle() and not store.is_dirty(player.stats):
+				evicted.append(member_id)
+
+		for member_id in evicted:
+			del self.players[member_id]
+
+	def _remove_if_empty(self, team_id: int):
+		# The default team is kept, so it doesn't come back as a regular team
+		if team_id != 0 and len(self.teams[team_id].member_ids) == 0:
+			del self.teams[team_id]
 
 	def mark_member_active(self, member: discord.Member):
-		self.players[member].stats.set_active()
+		player = self.get_player(member)
+		player.stats.set_active()
+
+		if member.id not in self.active_ids:
+			self.active_ids.add(member.id)
+			player.team.num_active += 1
+			player.team.version += 1
+
+	def check_team_aggregates(self, rebuild: bool = False) -> list[str]:
+		"""
+		Checks every team against the stats of the members, without creating their players:
+		which members each team has, the leaderboards, and each team's hits, crit hits,
+		stage and active members. O(members), so it's meant for benchmarks, simulations
+		and repairs rather than every move.
+
+		:param rebuild: Whether to rebuild whatever is off from the members' stats
+		:return: What didn't match, empty if everything did
+		"""
+
+		problems = []
+
+		# Which team each member is on comes from their stats
+		expected_member_ids: dict[int, set[int]] = {}
+		num_hits: dict[int, int] = {}
+		for member_id in self.member_ids:
+			expected_member_ids.setdefault(self._peek(member_id, "team_id"), set()).add(member_id)
+			num_hits[member_id] = self._peek(member_id, "num_hits")
+
+		for team_id in expected_member_ids.keys() | self.teams.keys():
+			member_ids = expected_member_ids.get(team_id, set())
+			team_member_ids = self.teams[team_id].member_ids if team_id in self.teams else set()
+
+			for member_id in team_member_ids - member_ids:
+				problems.append(f"Team {team_id} has {member_id}, who isn't on it")
+			for member_id in member_ids - team_member_ids:
+				problems.append(f"Team {team_id} is missing {member_id}")
+
+			if rebuild and team_member_ids != member_ids:
+				team = self._get_team(team_id)
+				team.member_ids = set(member_ids)
+				team.version += 1
+
+		if rebuild:
+			for team_id in list(self.teams):
+				self._remove_if_empty(team_id)
+
+			for player in self.players.values():
+				player.team = self.teams[player.stats.team_id]
+
+		problems.extend(self._check_leaderboard(self.leaderboard, num_hits, "Leaderboard", rebuild))
+
+		for team_id, team in self.teams.items():
+			team_num_hits = {member_id: num_hits[member_id] for member_id in team.member_ids if member_id in num_hits}
+			problems.extend(self._check_leaderboard(team.leaderboard, team_num_hits, f"Team {team_id} leaderboard", rebuild))
+
+			num_been_hit = 0
+			num_crit_hits = 0
+			num_active = 0
+			for member_id in team.member_ids:
+				num_been_hit += self._peek(member_id, "num_been_hit")
+				num_crit_hits += self._peek(member_id, "num_been_crit_hit")
+				num_active += member_id in self.active_ids
+
+			problems.extend(f"Team {team_id} {problem}" for problem in team.check_hits(num_been_hit, num_crit_hits, rebuild))
+
+			if team.num_active != num_active:
+				problems.append(f"Team {team_id} active members are {team.num_active}, recounted {num_active}")
+				if rebuild:
+					team.num_active = num_active
+					team.version += 1
+
+		return problems
+
+	@staticmethod
+	def _check_leaderboard(leaderboard: Leaderboard, num_hits: dict[int, int], name: str, rebuild: bool) -> list[str]:
+		problems = []
+
+		ranked = leaderboard.items()
+		for member_id in ranked.keys() - num_hits.keys():
+			problems.append(f"{name} has {member_id}, who shouldn't be on it")
+			if rebuild:
+				leaderboard.remove(member_id)
+
+		for member_id, member_num_hits in num_hits.items():
+			if ranked.get(member_id) != member_num_hits:
+				problems.append(f"{name} has {member_id} at {ranked.get(member_id)} hits, recounted {member_num_hits}")
+				if rebuild:
+					leaderboard.update(member_id, member_num_hits)
+
+		return problems
+
+	def reassign(self, team_ids: dict[int, int]):
+		"""
+		Moves many members at once, without creating their players.
+		Team stages are only recalculated once per affected team, and the changed
+		stats are left for the next flush to save in one batch.
+
+		:param team_ids: New team id for each member id
+		"""
+
+		affected_team_ids = set()
+
+		for member_id, team_id in team_ids.items():
+			stats = self._get_stats(member_id)
+			if stats.team_id == team_id:
+				continue
+
+			old_team = self.teams[stats.team_id]
+			new_team = self._get_team(team_id)
+
+			is_active = member_id in self.active_ids
+			old_team.remove_member(member_id, stats.num_been_hit, stats.num_been_crit_hit, is_active, update_stage=False)
+			new_team.add_member(member_id, stats.num_hits, stats.num_been_hit, stats.num_been_crit_hit, is_active, update_stage=False)
+
+			stats.set_team(team_id)
+			if member_id in self.players:
+				self.players[member_id].team = new_team
+
+			affected_team_ids.add(old_team.id)
+			affected_team_ids.add(new_team.id)
+
+		for team_id in affected_team_ids:
+			self.teams[team_id]._calculate_stage_index()
+			self._remove_if_empty(team_id)
 
 	def get_player(self, member: discord.Member) -> Player:
-		return self.players[member]
-
-	def get_active_players(self) -> list[Player]:
-		players = []
-		for player in self.players.values():
-			if player.stats.active:
-				players.append(player)
-		return players
-
-	def get_non_active_players(self) -> list[Player]:
-		players = []
-		for player in self.players.values():
-			if not player.stats.active:
-				players.append(player)
-		return players
-
-	def get_players_on_team(self, team_id: int) -> list[Player]:
+		"""
+		:raises KeyError: If the member isn't eligible to play, see check_is_player
+		"""
+
+		if member.id in self.players:
+			self.players.move_to_end(member.id)
+			return self.players[member.id]
+
+		if member.id not in self.member_ids:
+			# Members that joined since load are registered here, bots and ignored members never are
+			if not self.is_eligible(member):
+				raise KeyError(member.id)
+
+			self._register(member.id)
+
+		player = Player(member)
+		player.team = self.teams[player.stats.team_id]
+
+		self.players[member.id] = player
+		self._evict_idle_players()
+
+		return player
+
+	def get_player_by_id(self, member_id: int) -> Player | None:
+		member = self.guild.get_member(member_id)
+		if member is None:
+			return None
+
+		return self.get_player(member)
+
+	def _iter_players(self, member_ids: Iterable[int]) -> Iterator[Player]:
+		for member_id in member_ids:
+			player = self.get_player_by_id(member_id)
+			if player is not None:
+				yield player
+
+	# The get_*_players views iterate the live indexes, so players mustn't be moved while iterating them
+
+	def get_active_players(self) -> Iterator[Player]:
+		return self._iter_players(self.active_ids)
+
+	def get_non_active_players(self) -> Iterator[Player]:
+		return self._iter_players(member_id for member_id in self.member_ids if member_id not in self.active_ids)
+
+	def get_players_on_team(self, team_id: int) -> Iterator[Player]:
 		if team_id not in self.teams:
-			return []
+			return iter(())
 
-		return list(self.teams[team_id].players)
+		return self._iter_players(self.teams[team_id].member_ids)
 
 	def check_is_player(self, member: discord.Member) -> bool:
-		return member in self.players
+		return self.is_eligible(member)
+
+	def get_top_players(self, num_players: int, team_id: int | None = None) -> list[Player]:
+		leaderboard = self.leaderboard if team_id is None else self.teams[team_id].leaderboard
+
+		return list(self._iter_players(leaderboard.top(num_players)))
 
-	def get_sorted_players(self) -> list[Player]:
-		return sorted(self.players.values(), key=lambda e: e.stats.num_hits, reverse=True)
+	def get_rank(self, member: discord.Member, team_id: int | None = None) -> int | None:
+		leaderboard = self.leaderboard if team_id is None else self.teams[team_id].leaderboard
+
+		return leaderboard.rank(member.id)
+
+	def _update_ranking(self, player: Player):
+		self.leaderboard.update(player.member.id, player.stats.num_hits)
+		player.team.leaderboard.update(player.member.id, player.stats.num_hits)
 
 	def is_team(self, team_id: int) -> bool:
 		return team_id in self.teams
@@ -65,18 +330,27 @@ class TeamGroup:
 		return self.teams[team_id]
 
 	def get_team_of(self, member: discord.Member) -> "Team":
-		return self.teams[self.get_player(member).stats.team_id]
+		return self.get_player(member).team
 
 	async def collect_for(self, ctx: commands.Context, member: discord.Member):
-		await self.get_player(member).collect(ctx)
+		if not self.check_is_player(member):
+			await outbox.reply(ctx, f"User {member} is not a player", ephemeral=True, priority=Priority.COSMETIC)
+			return
+
+		player = self.get_player(member)
+		await player.reply_collect(ctx, player.try_collect())
 
 	async def throw_for(self, ctx: commands.Context, member: discord.Member, target: discord.Member) -> bool:
+		if not self.check_is_player(member):
+			await outbox.reply(ctx, f"User {member} is not a player", ephemeral=True, priority=Priority.COSMETIC)
+			return False
+
 		if target == member:
-			await ctx.reply("Why are you hitting yourself?")
+			await outbox.reply(ctx, "Why are you hitting yourself?", ephemeral=True, priority=Priority.COSMETIC)
 			return False
 
 		if not self.check_is_player(target):
-			await ctx.reply(f"User {target} is not a player")
+			await outbox.reply(ctx, f"User {target} is not a player", ephemeral=True, priority=Priority.COSMETIC)
 			return False
 
 		player = self.get_player(member)
@@ -85,60 +359,50 @@ class TeamGroup:
 		# Check for friendly fire
 		if player.stats.team_id == target_player.stats.team_id:
 			if not self.get_team_of(member).allow_friendly_fire:
-				await ctx.reply(f"You're on the same team!\nThis team does not allow for friendly fire")
+				await outbox.reply(ctx, f"You're on the same team!\nThis team does not allow for friendly fire", ephemeral=True, priority=Priority.COSMETIC)
 				return False
 
-		return await player.throw(ctx, target_player)
+		# The game state is only changed here, between awaits, so each throw is applied as a whole
+		result = player.try_throw(target_player)
+		if result is not None:
+			self._update_ranking(player)
+
+			if result.team_response == 1:
+				event_log.append("stage", team=target_player.team.id)
 
+			if result.team_response == 2:  # Game over
+				return True
 
-class TeamStage:
-	def __init__(
-			self,
-			hits_to_progress: int,
-			xp_bonus: int,
-			crit_bonus_percentage: int,
-			cooldown_reduction_percent: int
-	):
-		self.hits_to_progress = hits_to_progress
+		await player.reply_throw(ctx, target_player, result)
+		return False
 
-		self.xp_bonus = xp_bonus
-		self.crit_bonus_percentage = crit_bonus_percentage
-		self.cooldown_reduction_percent = cooldown_reduction_percent
 
+class Team(Snowman):
+	__slots__ = ("id", "base_team", "allow_friendly_fire", "member_ids", "num_active", "leaderboard", "_rendered_fields")
+
+	def __init__(self, team_id: int, curve: StageCurve = TEAM_CURVE, allow_friendly_fire: bool = False, base_team: bool = False):
+		super().__init__(curve if not base_team else BASE_TEAM_CURVE)
 
-class Team:
-	def __init__(self, team_id: int, allow_friendly_fire: bool = False, base_team: bool = False):
 		self.id = team_id
 		self.base_team = base_team
 
-		self._current_stage_index = 0
-		self._previous_hits_to_progress = 0
-		if not base_team:
-			self._stages = (
-				TeamStage(40, 0, 0, 0),
-				TeamStage(50, 1, 20, 25),
-				TeamStage(60, 2, 40, 50),
-			)
-		else:
-			self._stages = (TeamStage(0, 0, 0, 0),)
-
 		self.allow_friendly_fire = allow_friendly_fire
 
-		self.players: set[Player] = set()
+		# Includes members that don't currently have a Player
+		self.member_ids: set[int] = set()
+		# Members in member_ids that have signed up
+		self.num_active = 0
+		self.leaderboard = Leaderboard()
 
-		self.total_been_hits = 0
-		self.crit_hits = 0
-		self.crit_hits_progress_effect = 0.5
-
-	@property
-	def current_stage(self) -> TeamStage:
-		if self._current_stage_index >= len(self._stages):
-			return self._stages[-1]
-
-		return self._stages[self._current_stage_index]
+		self._rendered_fields = FieldCache()
 
 	def embed_stats(self, embed: discord.Embed):
-		stats_message = f"Num players: `{len(self.players)}`\n"
+		for name, value, inline in self._rendered_fields.get(self.version, self._render_stats_fields):
+			embed.add_field(name=name, value=value, inline=inline)
+
+	def _render_stats_fields(self) -> list[tuple[str, str, bool]]:
+		stats_message = f"Num players: `{len(self.member_ids)}`\n"
+		stats_message += f"Signed up: `{self.num_active}`\n"
 		stats_message += f"Total hits: `{self.total_been_hits}`"
 
 		current_stage = self.current_stage
@@ -146,87 +410,50 @@ class Team:
 		bonus_message += f"Crit % 🔺: `{current_stage.crit_bonus_percentage}`\n"
 		bonus_message += f"Cooldown % 🔻: `{current_stage.cooldown_reduction_percent}`"
 
-		stage_progress_message = f"Stage: `{self._current_stage_index + 1}`/`{len(self._stages)}`\n"
-		if self._current_stage_index < len(self._stages):
-			stage_progress_message += "Progress: " + xp_bar(
-				(self.total_been_hits + int(self.crit_hits * self.crit_hits_progress_effect)) - self._previous_hits_to_progress,
-				current_stage.hits_to_progress
-			)
-			stage_progress_message += f"\n `{(self.total_been_hits + int(self.crit_hits * self.crit_hits_progress_effect)) - self._previous_hits_to_progress}/{current_stage.hits_to_progress}`"
+		stage_progress_message = f"Stage: `{self._current_stage_index + 1}`/`{len(self.curve)}`\n"
+		if self._current_stage_index < len(self.curve):
+			stage_progress = self.stage_progress
+			stage_progress_message += "Progress: " + xp_bar(stage_progress, current_stage.hits_to_progress)
+			stage_progress_message += f"\n `{stage_progress}/{current_stage.hits_to_progress}`"
 
-		embed.add_field(name="Team Stats:", value=stats_message)
+		fields = [("Team Stats:", stats_message, True)]
 
 		if not self.base_team:
-			embed.add_field(name="Team Bonuses:", value=bonus_message)
-			embed.add_field(name="Snowman:", value=stage_progress_message, inline=False)
-
-	def _calculate_stage_index(self):
-		stage_index = 0
-		total_been_hits = self.total_been_hits + int(self.crit_hits * self.crit_hits_progress_effect)
-		if total_been_hits == 0:
-			return
-
-		hits_to_progress = 0
-
-		for stage in self._stages:
-			total_been_hits -= stage.hits_to_progress
-
-			if total_been_hits < 0:
-				break
-
-			hits_to_progress += stage.hits_to_progress
-			stage_index += 1
+			fields.append(("Team Bonuses:", bonus_message, True))
+			fields.append(("Snowman:", stage_progress_message, False))
 
-		self._current_stage_index = stage_index
-		self._previous_hits_to_progress = hits_to_progress
+		return fields
 
-	def add_player(self, player: Player):
-		player.team = self
-		self.players.add(player)
+	def add_member(self, member_id: int, num_hits: int, num_been_hit: int, num_been_crit_hit: int, active: bool, update_stage: bool = True):
+		self.member_ids.add(member_id)
+		self.leaderboard.update(member_id, num_hits)
+		self.num_active += active
+		self.version += 1
 
-		self.total_been_hits += player.stats.num_been_hit
-		self.crit_hits += player.stats.num_been_crit_hit
+		self.add_hits(num_been_hit, num_been_crit_hit)
 
-		self._calculate_stage_index()
+		if update_stage:
+			self._calculate_stage_index()
 
-	def remove_player(self, player: Player):
-		player.team = None
-		self.players.remove(player)
+	def remove_member(self, member_id: int, num_been_hit: int, num_been_crit_hit: int, active: bool, update_stage: bool = True):
+		self.member_ids.remove(member_id)
+		self.leaderboard.remove(member_id)
+		self.num_active -= active
+		self.version += 1
 
-		self.total_been_hits -= player.stats.num_been_hit
+		self.add_hits(-num_been_hit, -num_been_crit_hit)
 
-		self._calculate_stage_index()
-
-	def hit_player_on_team(self, critical: bool) -> int:
-		self.total_been_hits += 1
-		self.crit_hits += critical
-
-		if self._current_stage_index >= len(self._stages):
-			return 0
-
-		if (self.total_been_hits + int(self.crit_hits * self.crit_hits_progress_effect)) - self._previous_hits_to_progress >= self.current_stage.hits_to_progress:
-			self._previous_hits_to_progress += self.current_stage.hits_to_progress
-			self._current_stage_index += 1
-
-			if self._current_stage_index + 1 > len(self._stages):
-				return 2
-
-			return 1
-
-		return 0
-
-	async def send_team_level_up_message(self, ctx: commands.Context):
-		current_stage = self.current_stage
+		if update_stage:
+			self._calculate_stage_index()
 
+	def level_up_embed(self, stage: TeamStage) -> discord.Embed:
 		message = "New stats:\n"
-		message += f"XP Bonus: `{current_stage.xp_bonus}`\n"
-		message += f"Crit % 🔺: `{current_stage.crit_bonus_percentage}`\n"
-		message += f"Cooldown % 🔻: `{current_stage.cooldown_reduction_percent}`"
+		message += f"XP Bonus: `{stage.xp_bonus}`\n"
+		message += f"Crit % 🔺: `{stage.crit_bonus_percentage}`\n"
+		message += f"Cooldown % 🔻: `{stage.cooldown_reduction_percent}`"
 
-		embed = discord.Embed(
+		return discord.Embed(
 			title=f"Team {self.id}'s snowman has leveled up!",
 			description=message,
 			color=LEVEL_UP_COLOR
 		)
-
-		await ctx.send(embed=embed)